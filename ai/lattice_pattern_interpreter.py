@@ -4,24 +4,37 @@
 
 import numpy as np
 from sklearn.cluster import DBSCAN
+from scipy import ndimage
 from scipy.ndimage import gaussian_filter
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 import matplotlib.pyplot as plt
 
 class LatticePatternInterpreter:
     """
     Interprets patterns from the rendered photonic lattice data.
     Detects recurring structures, anomalies, and modulation logic in the signal.
+
+    Clustering works directly on the raster: 'components' labels 8-connected
+    above-mean regions, 'density' is an exact grid-native DBSCAN (neighbour
+    counts by convolution, core links by pixel offsets within eps), and 'dbscan'
+    runs sklearn's DBSCAN on the point list. pyramid_levels > 0 first finds
+    occupied regions on a downsampled mask and clusters each region separately.
     """
 
-    def __init__(self, eps=0.05, min_samples=5, smoothing_sigma=1.0):
+    def __init__(self, eps=1.5, min_samples=5, smoothing_sigma=1.0, method='density', pyramid_levels=0):
         """
-        eps: DBSCAN clustering sensitivity
-        min_samples: Minimum samples to form a cluster
+        eps: clustering radius in pixels
+        min_samples: Minimum samples to form a cluster (density/dbscan) or minimum component size
         smoothing_sigma: Gaussian blur level to reduce noise
+        method: 'density', 'components' or 'dbscan'
+        pyramid_levels: coarse-to-fine levels (each halves the resolution of the region search)
         """
         self.eps = eps
         self.min_samples = min_samples
         self.smoothing_sigma = smoothing_sigma
+        self.method = method
+        self.pyramid_levels = pyramid_levels
 
     def preprocess(self, lattice_data):
         """
@@ -30,14 +43,141 @@ class LatticePatternInterpreter:
         smoothed = gaussian_filter(lattice_data, sigma=self.smoothing_sigma)
         return smoothed
 
+    def _offsets(self):
+        """
+        Pixel offsets (dy, dx) within eps of the origin, excluding the origin.
+        """
+        r = int(np.floor(self.eps))
+        dy, dx = np.mgrid[-r:r + 1, -r:r + 1]
+        keep = (dy ** 2 + dx ** 2 <= self.eps ** 2) & ((dy != 0) | (dx != 0))
+        return list(zip(dy[keep].tolist(), dx[keep].tolist()))
+
+    @staticmethod
+    def _shifted_pairs(shape, dy, dx):
+        """
+        Slices (src, dst) such that image[dst] is image[src] shifted by (dy, dx).
+        """
+        h, w = shape
+        src = (slice(max(0, -dy), h - max(0, dy)), slice(max(0, -dx), w - max(0, dx)))
+        dst = (slice(max(0, dy), h + min(0, dy)), slice(max(0, dx), w + min(0, dx)))
+        return src, dst
+
+    def _label_components(self, mask):
+        """
+        8-connected components; components smaller than min_samples become noise.
+        """
+        label_img, count = ndimage.label(mask, structure=np.ones((3, 3), dtype=bool))
+        sizes = np.bincount(label_img.ravel(), minlength=count + 1)
+        keep = sizes >= self.min_samples
+        keep[0] = False
+        remap = np.full(count + 1, -1, dtype=np.int32)
+        remap[keep] = np.arange(np.count_nonzero(keep), dtype=np.int32)
+        return remap[label_img]
+
+    def _label_density(self, mask):
+        """
+        DBSCAN on the raster with radius eps (pixels): identical clusters to
+        point-based DBSCAN, up to the assignment of border points shared by clusters.
+        """
+        offsets = self._offsets()
+        kernel_r = int(np.floor(self.eps))
+        yy, xx = np.mgrid[-kernel_r:kernel_r + 1, -kernel_r:kernel_r + 1]
+        kernel = (yy ** 2 + xx ** 2 <= self.eps ** 2).astype(np.int32)
+        counts = ndimage.correlate(mask.astype(np.int32), kernel, mode='constant')
+        core = mask & (counts >= self.min_samples)
+
+        core_id = np.full(mask.shape, -1, dtype=np.int64)
+        n_core = int(np.count_nonzero(core))
+        core_id[core] = np.arange(n_core)
+        rows, cols = [], []
+        for dy, dx in offsets:
+            if (dy, dx) < (0, 0):
+                continue  # each undirected link once
+            src, dst = self._shifted_pairs(mask.shape, dy, dx)
+            a, b = core_id[src], core_id[dst]
+            linked = (a >= 0) & (b >= 0)
+            rows.append(a[linked])
+            cols.append(b[linked])
+        rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+        cols = np.concatenate(cols) if cols else np.empty(0, dtype=np.int64)
+        graph = coo_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(n_core, n_core))
+        _, component = connected_components(graph, directed=False)
+
+        label_img = np.full(mask.shape, -1, dtype=np.int32)
+        label_img[core] = component
+        # Border points join the cluster of any core point within eps
+        border = mask & ~core
+        for dy, dx in offsets:
+            src, dst = self._shifted_pairs(mask.shape, dy, dx)
+            target = label_img[dst]
+            take = border[dst] & (target == -1) & core[src]
+            target[take] = label_img[src][take]
+        # Renumber by first appearance in raster order, like sklearn
+        flat = label_img[mask]
+        _, first = np.unique(flat[flat >= 0], return_index=True)
+        remap = np.full(int(flat.max()) + 2 if flat.size else 1, -1, dtype=np.int32)
+        remap[flat[flat >= 0][np.sort(first)]] = np.arange(len(first), dtype=np.int32)
+        return remap[label_img]
+
+    def _label_dbscan(self, mask):
+        """
+        Point-based sklearn DBSCAN (eps in pixels) rendered back into a label image.
+        """
+        label_img = np.full(mask.shape, -1, dtype=np.int32)
+        coords = np.column_stack(np.nonzero(mask))
+        if len(coords):
+            label_img[mask] = DBSCAN(eps=self.eps, min_samples=self.min_samples).fit(coords).labels_
+        return label_img
+
+    def _label_mask(self, mask):
+        if self.method == 'components':
+            return self._label_components(mask)
+        if self.method == 'density':
+            return self._label_density(mask)
+        if self.method == 'dbscan':
+            return self._label_dbscan(mask)
+        raise ValueError(f"Unknown clustering method: {self.method}")
+
+    def _label_pyramid(self, mask):
+        """
+        Coarse-to-fine: find occupied regions on a downsampled mask (block size
+        2**pyramid_levels, at least eps + 1 so separate regions cannot interact),
+        then cluster each region's crop at full resolution.
+        """
+        block = max(2 ** self.pyramid_levels, int(np.floor(self.eps)) + 1)
+        h, w = mask.shape
+        padded = np.zeros((-(-h // block) * block, -(-w // block) * block), dtype=bool)
+        padded[:h, :w] = mask
+        coarse = padded.reshape(padded.shape[0] // block, block, -1, block).any(axis=(1, 3))
+        regions, _ = ndimage.label(coarse, structure=np.ones((3, 3), dtype=bool))
+
+        label_img = np.full(mask.shape, -1, dtype=np.int32)
+        next_label = 0
+        for k, box in enumerate(ndimage.find_objects(regions), start=1):
+            fine = tuple(slice(s.start * block, min(s.stop * block, dim)) for s, dim in zip(box, mask.shape))
+            footprint = np.kron(regions[box] == k, np.ones((block, block), dtype=bool))
+            crop = mask[fine] & footprint[:fine[0].stop - fine[0].start, :fine[1].stop - fine[1].start]
+            crop_labels = self._label_mask(crop)
+            clustered = crop_labels >= 0
+            label_img[fine][clustered] = crop_labels[clustered] + next_label
+            next_label += int(crop_labels.max()) + 1 if clustered.any() else 0
+        return label_img
+
+    def label_image(self, mask):
+        """
+        Cluster a boolean raster; returns an int32 label image (-1 = noise / background).
+        """
+        return self._label_pyramid(mask) if self.pyramid_levels > 0 else self._label_mask(mask)
+
     def detect_clusters(self, smoothed_data):
         """
-        Use DBSCAN to identify clustered regions in normalized data.
+        Cluster above-mean pixels of the smoothed lattice.
         Returns: cluster labels and coordinates
         """
-        coords = np.column_stack(np.nonzero(smoothed_data > np.mean(smoothed_data)))
-        clustering = DBSCAN(eps=self.eps, min_samples=self.min_samples).fit(coords)
-        return clustering.labels_, coords
+        mask = smoothed_data > np.mean(smoothed_data)
+        label_img = self.label_image(mask)
+        coords = np.column_stack(np.nonzero(mask))
+        return label_img[mask], coords
 
     def render_clusters(self, labels, coords, title='AI Interpreted Pattern Clusters'):
         """
@@ -52,11 +192,311 @@ class LatticePatternInterpreter:
         plt.tight_layout()
         plt.show()
 
-    def analyze(self, lattice_data):
+    def analyze(self, lattice_data, render=True):
         """
-        Full pipeline: smooth ➝ cluster ➝ visualize
+        Full pipeline: smooth ➝ cluster ➝ visualize (render=False for headless runs)
         """
         smoothed = self.preprocess(lattice_data)
         labels, coords = self.detect_clusters(smoothed)
-        self.render_clusters(labels, coords)
+        if render:
+            self.render_clusters(labels, coords)
         return labels, coords
+
+
+class LatticeClusterTracker:
+    """
+    Stateful frame-to-frame cluster tracking for a live lattice feed.
+    Each update finds the tiles that changed since the previous frame and re-smooths
+    them. Every connected group of changed tiles is then re-clustered in its own
+    crop, covering the pixels within smoothing reach plus eps of the group and any
+    cluster touching them, and stable track IDs are carried across frames. Updates
+    report births, deaths and centroid motion instead of isolated label sets.
+
+    The above-mean threshold is frozen at the last full rebuild; once the frame
+    mean drifts by more than threshold_tol standard deviations the whole
+    lattice is re-clustered (IDs are still carried over by pixel overlap).
+    """
+
+    def __init__(self, interpreter=None, tile_size=32, change_tol=1e-3, threshold_tol=0.05):
+        """
+        interpreter: LatticePatternInterpreter supplying smoothing and clustering settings
+        tile_size: change-detection tile edge in pixels (should exceed 4 * sigma and eps)
+        change_tol: max absolute per-pixel difference ignored when detecting changed tiles
+                    (default suits frames normalized to [0, 1])
+        threshold_tol: allowed drift of the frame mean, in smoothed standard deviations
+        """
+        self.interpreter = interpreter or LatticePatternInterpreter()
+        self.tile_size = tile_size
+        self.change_tol = change_tol
+        self.threshold_tol = threshold_tol
+        self.frame_index = -1
+        self.frame = None
+        self.smoothed = None
+        self.mask = None
+        self.labels = None
+        self.tracks = {}
+        self.next_id = 0
+        self.last_stats = {}
+
+    def _tile_grid(self, shape):
+        return (-(-shape[0] // self.tile_size), -(-shape[1] // self.tile_size))
+
+    def _tiles_to_pixels(self, tiles, shape):
+        """
+        Upsample a tile mask to a pixel mask of `shape`.
+        """
+        pixels = np.kron(tiles, np.ones((self.tile_size, self.tile_size), dtype=bool))
+        return pixels[:shape[0], :shape[1]]
+
+    def _changed_tiles(self, frame):
+        """
+        Tiles holding a pixel that moved by more than change_tol. The diff runs one
+        tile row at a time so its temporaries stay cache-resident.
+        """
+        rows, cols = self._tile_grid(frame.shape)
+        changed = np.zeros((rows, cols), dtype=bool)
+        column_max = np.zeros(cols * self.tile_size)
+        buffer = np.empty((self.tile_size, frame.shape[1]))
+        for r in range(rows):
+            band = slice(r * self.tile_size, (r + 1) * self.tile_size)
+            diff = buffer[:min(frame.shape[0], band.stop) - band.start]
+            np.subtract(frame[band], self.frame[band], out=diff)
+            np.abs(diff, out=diff)
+            diff.max(axis=0, out=column_max[:frame.shape[1]])
+            changed[r] = column_max.reshape(cols, self.tile_size).max(axis=1) > self.change_tol
+        return changed
+
+    def _clusters(self):
+        """
+        Track labels and coordinates of the above-threshold pixels (detect_clusters contract).
+        """
+        flat = np.flatnonzero(self.mask)
+        coords = np.empty((len(flat), 2), dtype=np.intp)
+        np.divmod(flat, self.mask.shape[1], out=(coords[:, 0], coords[:, 1]))
+        return self.labels.ravel()[flat], coords
+
+    @staticmethod
+    def _grow(box, margin, shape):
+        return tuple(slice(max(0, s.start - margin), min(dim, s.stop + margin)) for s, dim in zip(box, shape))
+
+    def _stats(self, ids, region):
+        """
+        Size, centroid and bounding box of the given track IDs, all of which lie inside `region`.
+        """
+        ids = np.asarray(sorted(ids), dtype=np.int64)
+        if ids.size == 0:
+            return {}
+        local = self.labels[region]
+        which = np.where(np.isin(local, ids), np.searchsorted(ids, local) + 1, 0)
+        ys, xs = np.nonzero(which)
+        which = which[ys, xs] - 1
+        ys = ys + region[0].start
+        xs = xs + region[1].start
+        counts = np.bincount(which, minlength=len(ids))
+        sum_y = np.bincount(which, weights=ys, minlength=len(ids))
+        sum_x = np.bincount(which, weights=xs, minlength=len(ids))
+        # Per-ID extents: reduce the pixel coordinates over each ID's sorted run
+        order = np.argsort(which, kind='stable')
+        starts = np.searchsorted(which[order], np.arange(len(ids)))
+        present = counts > 0
+        bounds = [np.full(len(ids), -1, dtype=np.int64) for _ in range(4)]
+        if present.any():
+            runs = starts[present]
+            for k, (coord, ufunc) in enumerate([(ys, np.minimum), (ys, np.maximum), (xs, np.minimum), (xs, np.maximum)]):
+                bounds[k][present] = ufunc.reduceat(coord[order], runs)
+        return {int(i): (int(c), (float(sy / c), float(sx / c)), (slice(int(y0), int(y1) + 1), slice(int(x0), int(x1) + 1)))
+                for i, c, sy, sx, y0, y1, x0, x1 in zip(ids, counts, sum_y, sum_x, *bounds) if c}
+
+    def _assign(self, region, crop_labels, write, events):
+        """
+        Write re-clustered crop labels into the `write` pixels of `region`, mapping them
+        onto existing track IDs by greatest pixel overlap. Returns the track IDs touched.
+        """
+        old = self.labels[region][write]
+        new = crop_labels[write]
+        n_new = int(new.max()) + 1 if new.size else 0
+        new_ids = np.full(n_new, -1, dtype=np.int64)
+        valid = (new >= 0) & (old >= 0)
+        if valid.any():
+            # (new, old) pairs packed into one int64 key: a 1-D unique is far cheaper than axis=0
+            keys, counts = np.unique(old[valid] * n_new + new[valid], return_counts=True)
+            used = set()
+            for k in np.argsort(-counts, kind='stable'):
+                prev, cluster = divmod(int(keys[k]), n_new)
+                if new_ids[cluster] == -1 and prev not in used:
+                    new_ids[cluster] = prev
+                    used.add(prev)
+        present = np.flatnonzero(np.bincount(new[new >= 0], minlength=n_new))
+        for cluster in present:
+            if new_ids[cluster] == -1:
+                new_ids[cluster] = self.next_id
+                self.tracks[self.next_id] = {'birth_frame': self.frame_index}
+                events['births'].append(self.next_id)
+                self.next_id += 1
+        mapped = np.full(new.shape, -1, dtype=np.int64)
+        mapped[new >= 0] = new_ids[new[new >= 0]]
+        self.labels[region][write] = mapped
+        return set(np.unique(old[old >= 0]).tolist()) | set(new_ids[present].tolist())
+
+    def _finish(self, parts, events):
+        """
+        Update track records for the IDs touched in each (touched, stats) part and
+        emit deaths / motion. Later parts supersede earlier ones for shared IDs.
+        """
+        stats = {}
+        for ids, part_stats in parts:
+            for track_id in ids:
+                stats.pop(track_id, None)
+            stats.update(part_stats)
+        touched = set().union(*(ids for ids, _ in parts))
+        for track_id in sorted(touched):
+            record = self.tracks.get(track_id)
+            if record is None:
+                continue
+            if track_id not in stats:
+                events['deaths'].append(track_id)
+                del self.tracks[track_id]
+                continue
+            size, centroid, box = stats[track_id]
+            if 'centroid' in record and track_id not in events['births']:
+                shift = (centroid[0] - record['centroid'][0], centroid[1] - record['centroid'][1])
+                if shift != (0.0, 0.0):
+                    events['moved'][track_id] = shift
+            record.update(size=size, centroid=centroid, box=box, last_frame=self.frame_index)
+        return (*self._clusters(), events)
+
+    def _rebuild(self, frame, events):
+        """
+        Full smooth + cluster of the frame, carrying IDs over by overlap when possible.
+        """
+        self.frame = frame
+        self.smoothed = self.interpreter.preprocess(frame)
+        self.threshold = float(np.mean(self.smoothed))
+        self.spread = float(np.std(self.smoothed))
+        self.smoothed_sum = float(np.sum(self.smoothed))
+        self.mask = self.smoothed > self.threshold
+        crop_labels = self.interpreter.label_image(self.mask)
+        if self.labels is None or self.labels.shape != frame.shape:
+            self.labels = np.full(frame.shape, -1, dtype=np.int64)
+            for track_id in list(self.tracks):
+                events['deaths'].append(track_id)
+            self.tracks = {}
+        region = (slice(0, frame.shape[0]), slice(0, frame.shape[1]))
+        touched = self._assign(region, crop_labels, np.ones(frame.shape, dtype=bool), events)
+        self.last_stats = {'changed_tiles': None, 'groups': None, 'reclustered_pixels': frame.size, 'full_rebuild': True}
+        return self._finish([(touched, self._stats(touched, region))], events)
+
+    def update(self, lattice_data):
+        """
+        Process the next lattice frame.
+        Returns: (track_labels, coords, events) where track_labels are stable track IDs
+        for coords (same contract as detect_clusters) and events holds 'births',
+        'deaths' and 'moved' ({track_id: (dy, dx)}).
+        """
+        frame = np.asarray(lattice_data, dtype=np.float64)
+        self.frame_index += 1
+        events = {'births': [], 'deaths': [], 'moved': {}}
+        if self.frame is None or frame.shape != self.frame.shape:
+            return self._rebuild(frame, events)
+
+        changed = self._changed_tiles(frame)
+        if not changed.any():
+            self.last_stats = {'changed_tiles': 0, 'groups': 0, 'reclustered_pixels': 0, 'full_rebuild': False}
+            return (*self._clusters(), events)
+
+        eight = np.ones((3, 3), dtype=bool)
+        smooth_tiles = ndimage.binary_dilation(changed, structure=eight)
+        smooth_margin = int(np.ceil(4.0 * self.interpreter.smoothing_sigma)) + 1
+        groups, _ = ndimage.label(smooth_tiles, structure=eight)
+        for box in ndimage.find_objects(groups):
+            inner = tuple(slice(s.start * self.tile_size, min(s.stop * self.tile_size, dim))
+                          for s, dim in zip(box, frame.shape))
+            outer = self._grow(inner, smooth_margin, frame.shape)
+            patch = self.interpreter.preprocess(frame[outer])
+            local = tuple(slice(i.start - o.start, i.stop - o.start) for i, o in zip(inner, outer))
+            self.smoothed_sum += float(np.sum(patch[local]) - np.sum(self.smoothed[inner]))
+            self.smoothed[inner] = patch[local]
+        self.frame = frame
+
+        if abs(self.smoothed_sum / frame.size - self.threshold) > self.threshold_tol * self.spread:
+            return self._rebuild(frame, events)
+
+        # The mask is refreshed only within smoothing reach of a changed tile, and labels
+        # can only change within eps of that or in clusters reaching it
+        eps_margin = int(np.ceil(self.interpreter.eps))
+        dirty = []
+        for k, group_box in enumerate(ndimage.find_objects(groups), start=1):
+            group_changed = changed[group_box] & (groups[group_box] == k)
+            tile_box = tuple(slice(g.start + s.start, g.start + s.stop)
+                             for g, s in zip(group_box, ndimage.find_objects(group_changed.astype(np.int8))[0]))
+            tiles = tuple(slice(s.start * self.tile_size, min(s.stop * self.tile_size, dim))
+                          for s, dim in zip(tile_box, frame.shape))
+            inner = self._grow(tiles, smooth_margin + eps_margin, frame.shape)
+            refresh = np.zeros(self.labels[inner].shape, dtype=bool)
+            refresh[tuple(slice(t.start - i.start, t.stop - i.start) for t, i in zip(tiles, inner))] = \
+                self._tiles_to_pixels(changed[tile_box] & (groups[tile_box] == k), self.labels[tiles].shape)
+            refresh = ndimage.maximum_filter(refresh, size=2 * smooth_margin + 1)
+            self.mask[inner][refresh] = self.smoothed[inner][refresh] > self.threshold
+            dirty.append((inner, ndimage.maximum_filter(refresh, size=2 * eps_margin + 1)))
+
+        # Each connected group of changed tiles is re-clustered in its own crop
+        boxes = {}
+        parts = []
+        reclustered = 0
+        for inner, near in dirty:
+            touched, region, crop_size = self._recluster(inner, near, boxes, events)
+            stats = self._stats(touched, region)
+            boxes.update((track_id, stats[track_id][2] if track_id in stats else None) for track_id in touched)
+            parts.append((touched, stats))
+            reclustered += crop_size
+        self.last_stats = {
+            'changed_tiles': int(np.count_nonzero(changed)),
+            'groups': len(parts),
+            'reclustered_pixels': reclustered,
+            'full_rebuild': False,
+        }
+        return self._finish(parts, events)
+
+    def _recluster(self, inner, near, boxes, events):
+        """
+        Re-cluster one group of changed tiles: the `near` pixels of box `inner` plus
+        every cluster they touch, in a crop grown until no blob absorbs an untouched
+        cluster or is cut by the crop edge. boxes holds bounding boxes that earlier
+        groups of this frame changed (the rest come from the track records).
+        Returns (touched track IDs, crop region, crop size).
+        """
+        shape = self.labels.shape
+        affected = set(np.unique(self.labels[inner][near]).tolist()) - {-1}
+        margin = 2 * int(np.ceil(self.interpreter.eps)) + 2
+        while True:
+            starts = [s.start for s in inner]
+            stops = [s.stop for s in inner]
+            for track_id in affected:
+                box = boxes[track_id] if track_id in boxes else self.tracks[track_id]['box']
+                for axis, s in enumerate(box):
+                    starts[axis] = min(starts[axis], s.start)
+                    stops[axis] = max(stops[axis], s.stop)
+            region = self._grow(tuple(map(slice, starts, stops)), margin, shape)
+            in_write = np.isin(self.labels[region], list(affected))
+            in_write[tuple(slice(i.start - r.start, i.stop - r.start) for i, r in zip(inner, region))] |= near
+            crop_labels = self.interpreter.label_image(self.mask[region])
+            hit = np.unique(crop_labels[in_write & (crop_labels >= 0)])
+            reach = np.isin(crop_labels, hit)
+            # A re-clustered blob that absorbs an untouched cluster makes that cluster affected
+            merged = set(np.unique(self.labels[region][reach & ~in_write]).tolist()) - {-1} - affected
+            # A blob cut by the crop edge (away from the image border) needs a larger crop
+            cut = any(
+                (s.start > 0 and reach[(slice(0, 1),) if axis == 0 else (slice(None), slice(0, 1))].any()) or
+                (s.stop < dim and reach[(slice(-1, None),) if axis == 0 else (slice(None), slice(-1, None))].any())
+                for axis, (s, dim) in enumerate(zip(region, shape))
+            )
+            if merged:
+                affected |= merged
+            elif cut:
+                margin *= 2
+            else:
+                break
+
+        # Pixels outside the write set that no re-clustered blob reached keep their labels
+        touched = self._assign(region, crop_labels, in_write | reach, events) | affected
+        return touched, region, crop_labels.size
@@ -3,26 +3,188 @@
 # Author: Bryce Wooster
 
 import hashlib
+import os
 import numpy as np
 import json
 from datetime import datetime
 
+# Every record line starts with this prefix, so hashes can be indexed without JSON parsing
+_HASH_PREFIX = b'{"signature_hash": "'
+_HASH_LEN = 64
+
+# Similarity sketch: [log cluster count, global centroid (2), top cluster (size fraction,
+# centroid) triples, log2 cluster-size histogram]
+SKETCH_TOP_CLUSTERS = 8
+SKETCH_SIZE_BINS = 16
+SKETCH_DIM = 3 + 3 * SKETCH_TOP_CLUSTERS + SKETCH_SIZE_BINS
+SKETCH_DTYPE = np.dtype([('hash', 'V32'), ('sketch', '<f4', (SKETCH_DIM,))])
+
+def compute_sketch(coords, labels, coord_scale=512.0):
+    """
+    Compact, fixed-length similarity sketch of a clustering: cluster count, centroid
+    geometry and cluster-size histogram. Nearly identical patterns give nearby sketches.
+    """
+    coords = np.asarray(coords, dtype=np.float64).reshape(len(labels), -1)[:, :2]
+    labels = np.asarray(labels)
+    sketch = np.zeros(SKETCH_DIM, dtype=np.float32)
+    if len(coords):
+        sketch[1:3] = coords.mean(axis=0) / coord_scale
+    clustered = labels >= 0
+    ids, inverse, counts = np.unique(labels[clustered], return_inverse=True, return_counts=True)
+    sketch[0] = np.log1p(len(ids))
+    if len(ids):
+        points = coords[clustered]
+        centroids = np.column_stack([
+            np.bincount(inverse, weights=points[:, d], minlength=len(ids)) for d in range(2)
+        ]) / counts[:, None] / coord_scale
+        top = np.argsort(-counts, kind='stable')[:SKETCH_TOP_CLUSTERS]
+        block = np.column_stack([counts[top] / len(labels), centroids[top]])
+        sketch[3:3 + block.size] = block.ravel()
+        size_bins = np.minimum(np.log2(counts).astype(np.int64), SKETCH_SIZE_BINS - 1)
+        sketch[3 + 3 * SKETCH_TOP_CLUSTERS:] = np.bincount(size_bins, minlength=SKETCH_SIZE_BINS) / len(ids)
+    return sketch
+
+class SignatureSimilarityIndex:
+    """
+    Locality-sensitive (p-stable, Euclidean) index over signature sketches. Each of
+    n_tables hashes a sketch into a bucket of nearby sketches; a query only ranks the
+    union of its buckets, so lookups stay sub-millisecond at hundreds of thousands of entries.
+    """
+
+    def __init__(self, dim=SKETCH_DIM, n_tables=8, n_bits=4, bucket_width=0.25, seed=369):
+        rng = np.random.default_rng(seed)
+        self.bucket_width = bucket_width
+        self.projections = rng.normal(size=(n_tables * n_bits, dim))
+        self.offsets = rng.uniform(0, bucket_width, size=n_tables * n_bits)
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.tables = [{} for _ in range(n_tables)]
+        self.sketches = np.empty((1024, dim), dtype=np.float32)
+        self.hashes = []
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def _keys(self, sketches):
+        """
+        Bucket keys shaped (n, n_tables) for a (n, dim) block of sketches.
+        """
+        codes = np.floor((sketches @ self.projections.T + self.offsets) / self.bucket_width).astype(np.int32)
+        codes = np.ascontiguousarray(codes.reshape(len(sketches), self.n_tables, self.n_bits))
+        return codes.view(np.dtype((np.void, 4 * self.n_bits)))[..., 0]
+
+    def add_many(self, signature_hashes, sketches):
+        sketches = np.atleast_2d(np.asarray(sketches, dtype=np.float32))
+        start = len(self.hashes)
+        needed = start + len(sketches)
+        if needed > len(self.sketches):
+            grown = np.empty((max(needed, 2 * len(self.sketches)), self.sketches.shape[1]), dtype=np.float32)
+            grown[:start] = self.sketches[:start]
+            self.sketches = grown
+        self.sketches[start:needed] = sketches
+        self.hashes.extend(signature_hashes)
+        for row, keys in enumerate(self._keys(sketches), start=start):
+            for table, key in zip(self.tables, keys.tolist()):
+                table.setdefault(key, []).append(row)
+
+    def add(self, signature_hash, sketch):
+        self.add_many([signature_hash], sketch)
+
+    def query(self, sketch, k=5, max_distance=None):
+        """
+        Return up to k (signature_hash, distance) pairs of the nearest indexed sketches.
+        """
+        sketch = np.asarray(sketch, dtype=np.float32)
+        candidates = set()
+        for table, key in zip(self.tables, self._keys(sketch[None, :])[0].tolist()):
+            candidates.update(table.get(key, ()))
+        if not candidates:
+            return []
+        rows = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        distances = np.linalg.norm(self.sketches[rows] - sketch, axis=1)
+        order = np.argsort(distances, kind='stable')[:k]
+        return [(self.hashes[rows[i]], float(distances[i])) for i in order
+                if max_distance is None or distances[i] <= max_distance]
+
 class PatternSignatureExporter:
     """
     Extracts a reproducible signature from clustered photonic lattice data.
     Stores time-stamped signature IDs for historical tracking and comparison.
+
+    Signatures are appended to a line-delimited JSON log (one record per line),
+    so an export costs O(1) regardless of log size. Writes are batched
+    (flush_every records) and optionally fsync'd, and an in-memory
+    signature_hash -> byte offset index gives O(1) lookups. A similarity sketch of
+    every signature is appended to a binary sidecar (<export_path>.sketch) and kept
+    in a SignatureSimilarityIndex for "seen something like this?" queries.
     """
 
-    def __init__(self, export_path='signatures_db.json'):
+    def __init__(self, export_path='signatures_db.json', flush_every=1, fsync=False):
         self.export_path = export_path
-        self.signature_log = []
+        self.flush_every = flush_every
+        self.fsync = fsync
+        self.index = {}
+        self._pending = []
+        self._pending_bytes = 0
+        self._file = None
+        self._size = os.path.getsize(export_path) if os.path.exists(export_path) else 0
+        self.sketch_path = export_path + '.sketch'
+        self.similarity_index = SignatureSimilarityIndex()
+        self._pending_sketches = []
+        if self._size:
+            with open(export_path, 'rb') as f:
+                legacy = f.read(1) == b'['
+            if legacy:
+                # Convert a legacy JSON-array store before anything is appended to it
+                self.load_existing()
+            else:
+                self._drop_torn_tail()
+
+    def _drop_torn_tail(self):
+        """
+        Cut a record left half-written by a crash (no trailing newline) off the end of
+        the log, and any partial record off the sketch sidecar, so appends start on a
+        fresh line.
+        """
+        with open(self.export_path, 'rb+') as f:
+            end = f.seek(0, os.SEEK_END)
+            keep = end
+            while keep > 0:
+                step = min(4096, keep)
+                f.seek(keep - step)
+                newline = f.read(step).rfind(b'\n')
+                if newline >= 0:
+                    keep += newline + 1 - step
+                    break
+                keep -= step
+            if keep < end:
+                print(f"[WARN] Dropping {end - keep} bytes of a torn record from {self.export_path}")
+                f.truncate(keep)
+        self._size = keep
+        if os.path.exists(self.sketch_path):
+            sketch_size = os.path.getsize(self.sketch_path)
+            if sketch_size % SKETCH_DTYPE.itemsize:
+                with open(self.sketch_path, 'rb+') as f:
+                    f.truncate(sketch_size - sketch_size % SKETCH_DTYPE.itemsize)
 
     def generate_hash(self, coords, labels):
         """
         Create a unique hash from cluster label distribution and geometry.
+        Hashes the raw little-endian array bytes (plus shape) instead of their text form.
+        """
+        labels = np.ascontiguousarray(labels, dtype='<i8')
+        centroid = np.ascontiguousarray(np.asarray(coords).mean(axis=0), dtype='<f8')
+        digest = hashlib.sha256(np.array(labels.shape, dtype='<i8').tobytes())
+        digest.update(labels.tobytes())
+        digest.update(centroid.tobytes())
+        return digest.hexdigest()
+
+    def find_similar(self, coords, labels, k=5, max_distance=None):
+        """
+        Return up to k (signature_hash, sketch distance) pairs of stored signatures
+        resembling this clustering, nearest first.
         """
-        hash_input = f"{labels.tolist()}::{coords.mean(axis=0).tolist()}"
-        return hashlib.sha256(hash_input.encode()).hexdigest()
+        return self.similarity_index.query(compute_sketch(coords, labels), k=k, max_distance=max_distance)
 
     def export_signature(self, coords, labels, metadata=None):
         """
@@ -32,33 +194,157 @@ class PatternSignatureExporter:
         timestamp = datetime.utcnow().isoformat()
 
         entry = {
-            'timestamp_utc': timestamp,
             'signature_hash': signature_hash,
+            'timestamp_utc': timestamp,
             'centroid': coords.mean(axis=0).tolist(),
-            'cluster_count': len(set(labels)) - (1 if -1 in labels else 0),
+            'cluster_count': int(np.count_nonzero(np.unique(labels) != -1)),
             'metadata': metadata or {}
         }
 
-        self.signature_log.append(entry)
-        self._save_to_file()
+        line = (json.dumps(entry) + '\n').encode()
+        self.index[signature_hash] = self._size + self._pending_bytes
+        sketch = compute_sketch(coords, labels)
+        self.similarity_index.add(signature_hash, sketch)
+        self._pending_sketches.append((bytes.fromhex(signature_hash), sketch))
+        self._pending.append(line)
+        self._pending_bytes += len(line)
+        if len(self._pending) >= self.flush_every:
+            self.flush()
         return signature_hash
 
-    def _save_to_file(self):
+    def flush(self):
         """
-        Append the new signature to the JSON database.
+        Append buffered signatures to the log (and fsync if configured), then their
+        sketches to the sidecar. Sketches that fail to write are retried on the next flush.
         """
+        if self._pending:
+            try:
+                if self._file is None:
+                    self._file = open(self.export_path, 'ab')
+                self._file.write(b''.join(self._pending))
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+            except Exception as e:
+                print(f"[ERROR] Failed to save signature file: {e}")
+                return
+            # The lines are in the log now: never write them twice, even if the sidecar fails
+            self._size += self._pending_bytes
+            self._pending.clear()
+            self._pending_bytes = 0
+        if not self._pending_sketches:
+            return
         try:
-            with open(self.export_path, 'w') as f:
-                json.dump(self.signature_log, f, indent=2)
+            with open(self.sketch_path, 'ab') as sketch_file:
+                np.array(self._pending_sketches, dtype=SKETCH_DTYPE).tofile(sketch_file)
+                if self.fsync:
+                    sketch_file.flush()
+                    os.fsync(sketch_file.fileno())
+            self._pending_sketches.clear()
         except Exception as e:
-            print(f"[ERROR] Failed to save signature file: {e}")
+            print(f"[ERROR] Failed to save signature sketches (will retry): {e}")
+
+    def close(self):
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def get_signature(self, signature_hash):
+        """
+        Fetch one stored signature by hash via the offset index, or None.
+        """
+        offset = self.index.get(signature_hash)
+        if offset is None:
+            return None
+        if offset >= self._size:
+            # Still buffered: walk the pending lines to the record
+            position = self._size
+            for line in self._pending:
+                if position == offset:
+                    return json.loads(line)
+                position += len(line)
+            return None
+        with open(self.export_path, 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+    @property
+    def signature_log(self):
+        """
+        All stored signatures, oldest first (parses the whole log; prefer get_signature).
+        """
+        self.flush()
+        if not os.path.exists(self.export_path):
+            return []
+        records = []
+        with open(self.export_path, 'rb') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue  # blank or torn line
+        return records
 
     def load_existing(self):
         """
-        Load existing signature log from disk.
+        Index the existing signature log on disk. Only the fixed-position hash of each
+        line is read; records are parsed on demand. A legacy JSON-array database is
+        converted to the line-delimited format once.
         """
+        self.index = {}
         try:
-            with open(self.export_path, 'r') as f:
-                self.signature_log = json.load(f)
+            with open(self.export_path, 'rb') as f:
+                head = f.read(1)
+                f.seek(0)
+                if head == b'[':
+                    legacy = json.load(f)
+                else:
+                    legacy = None
+                    offset = 0
+                    for line in f:
+                        # Complete records only: a line without its newline was torn by a crash
+                        if line.startswith(_HASH_PREFIX) and line.endswith(b'\n'):
+                            start = len(_HASH_PREFIX)
+                            self.index[line[start:start + _HASH_LEN].decode()] = offset
+                        offset += len(line)
         except FileNotFoundError:
-            self.signature_log = []
+            self._size = 0
+            return
+        if legacy is not None:
+            self._migrate(legacy)
+        self._size = os.path.getsize(self.export_path)
+
+        self.similarity_index = SignatureSimilarityIndex()
+        if os.path.exists(self.sketch_path):
+            records = np.fromfile(self.sketch_path, dtype=SKETCH_DTYPE)
+            hashes = [h.hex() for h in records['hash'].tolist()]
+            self.similarity_index.add_many(hashes, records['sketch'])
+
+    def _migrate(self, entries):
+        """
+        Rewrite a legacy JSON-array database as one record per line (via a temp file).
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        offset = 0
+        temp_path = self.export_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            for entry in entries:
+                record = {'signature_hash': entry['signature_hash']}
+                record.update((k, v) for k, v in entry.items() if k != 'signature_hash')
+                line = (json.dumps(record) + '\n').encode()
+                f.write(line)
+                self.index[record['signature_hash']] = offset
+                offset += len(line)
+            f.flush()
+            os.fsync(f.fileno())
+        # Atomic swap: a crash leaves either the legacy database or the converted log
+        os.replace(temp_path, self.export_path)
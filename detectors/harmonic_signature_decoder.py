@@ -5,54 +5,187 @@
 import numpy as np
 from scipy.fft import fft
 
+class ReferenceLibrary(dict):
+    """
+    Fingerprint dictionary that bumps `version` on every mutation, so the compiled
+    match matrix is rebuilt only when the library actually changes. Arrays edited in
+    place are not seen; call HarmonicSignatureDecoder.invalidate() after doing so.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version = 0
+
+    def _changed(self):
+        self.version += 1
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._changed()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._changed()
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._changed()
+
+    def pop(self, *args):
+        value = super().pop(*args)
+        self._changed()
+        return value
+
+    def popitem(self):
+        item = super().popitem()
+        self._changed()
+        return item
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self._changed()
+        return super().setdefault(key, default)
+
+    def clear(self):
+        super().clear()
+        self._changed()
+
 class HarmonicSignatureDecoder:
     """
     Translates raw photon event data into harmonic signal codes using FFT and custom Tesla-derived 3-6-9 coherence models.
+    Reference fingerprints are compiled into one zero-padded matrix (plus cumulative
+    norms for truncated comparisons), so matching is a single matrix-vector product.
+
+    reference_patterns is used as given (not copied), so later edits to the caller's
+    mapping are seen. The default is an empty ReferenceLibrary, tracked by its version
+    counter at no per-match cost. A plain dict is only checked for a change in length,
+    so adding or removing tags is noticed but replacing a tag's fingerprint is not:
+    call invalidate() after doing so, or after editing any fingerprint array in place.
     """
 
     def __init__(self, reference_patterns=None):
-        self.reference_patterns = reference_patterns or {}
+        self.reference_patterns = ReferenceLibrary() if reference_patterns is None else reference_patterns
         self.last_spectrum = None
         self.last_match = None
+        self.last_score = None
 
-    def decode(self, photon_events):
+    @property
+    def reference_patterns(self):
+        return self._reference_patterns
+
+    @reference_patterns.setter
+    def reference_patterns(self, patterns):
+        self._reference_patterns = patterns
+        self._compiled_version = None
+
+    def _library_version(self):
+        library = self._reference_patterns
+        if isinstance(library, ReferenceLibrary):
+            return ('version', library.version)
+        # O(1): a per-entry comparison would cost a Python loop over the library per match
+        return ('length', len(library))
+
+    def invalidate(self):
         """
-        Convert photon event hits into frequency-domain representation.
-        Match with known resonance fingerprints.
+        Force a rebuild of the compiled reference matrix on the next match.
+        """
+        self._compiled_version = None
+
+    def _compile(self):
+        """
+        Build the (tags, max_len) reference matrix and per-prefix reference norms.
+        """
+        library = self._reference_patterns
+        version = self._library_version()
+        if self._compiled_version == version:
+            return
+        self._tags = list(library.keys())
+        refs = [np.asarray(library[tag], dtype=np.float64).ravel() for tag in self._tags]
+        self._ref_lengths = np.array([len(r) for r in refs], dtype=np.int64)
+        width = int(self._ref_lengths.max()) if refs else 0
+        self._ref_matrix = np.zeros((len(refs), width))
+        for i, ref in enumerate(refs):
+            self._ref_matrix[i, :len(ref)] = ref
+        # _ref_cumsq[i, m] = ||ref_i[:m]||^2, for comparisons truncated to m bins
+        self._ref_cumsq = np.zeros((len(refs), width + 1))
+        np.cumsum(self._ref_matrix ** 2, axis=1, out=self._ref_cumsq[:, 1:])
+        self._compiled_version = version
+
+    def score_spectra(self, spectra):
+        """
+        Score one spectrum (1-D) or a stack of equal-length spectra (2-D) against every
+        reference. Returns scores shaped (n_refs,) or (n_spectra, n_refs), ordered like
+        the library; each score is the cosine similarity over the shared prefix.
+        """
+        self._compile()
+        spectra = np.asarray(spectra, dtype=np.float64)
+        single = spectra.ndim == 1
+        spectra = np.atleast_2d(spectra)
+        n = min(spectra.shape[1], self._ref_matrix.shape[1])
+        dots = spectra[:, :n] @ self._ref_matrix[:, :n].T
+        shared = np.minimum(self._ref_lengths, spectra.shape[1])
+        spec_cumsq = np.zeros((spectra.shape[0], n + 1))
+        np.cumsum(spectra[:, :n] ** 2, axis=1, out=spec_cumsq[:, 1:])
+        ref_norms = np.sqrt(self._ref_cumsq[np.arange(len(shared)), shared])
+        spec_norms = np.sqrt(spec_cumsq[:, shared])
+        scores = dots / (spec_norms * ref_norms + 1e-8)
+        return scores[0] if single else scores
+
+    def match(self, spectrum, top_k=5):
+        """
+        Return the top_k (tag, score) pairs for a spectrum, best first.
+        """
+        scores = self.score_spectra(spectrum)
+        if scores.size == 0:
+            return []
+        top_k = min(top_k, scores.size)
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.lexsort((best, -scores[best]))]
+        return [(self._tags[i], float(scores[i])) for i in best]
+
+    def compute_spectrum(self, photon_events):
+        """
+        Magnitude spectrum of the photon inter-arrival times, or None if there are
+        too few events for harmonic inference.
         """
         if photon_events.shape[0] == 0:
             return None
 
         # Construct pseudo-waveform from time delta of photon arrivals
-        times = photon_events[:, 0]
-        deltas = np.diff(times)
+        if photon_events.dtype.names:
+            # PhotonEventMatrix records: integer nanosecond timestamps
+            deltas = np.diff(photon_events['timestamp_ns']) * 1e-9
+        else:
+            times = photon_events[:, 0]
+            deltas = np.diff(times)
 
         if len(deltas) < 16:
             return None  # not enough data for harmonic inference
 
         # Use FFT to analyze harmonic structure
-        spectrum = np.abs(fft(deltas - np.mean(deltas)))
+        return np.abs(fft(deltas - np.mean(deltas)))
+
+    def decode(self, photon_events):
+        """
+        Convert photon event hits into frequency-domain representation.
+        Match with known resonance fingerprints.
+        """
+        spectrum = self.compute_spectrum(photon_events)
+        if spectrum is None:
+            return None
         self.last_spectrum = spectrum
 
-        best_score = 0
         best_tag = None
-        for tag, ref in self.reference_patterns.items():
-            score = self._match_spectrum(spectrum, ref)
-            if score > best_score:
-                best_score = score
-                best_tag = tag
+        self.last_score = None
+        if self._reference_patterns:
+            scores = self.score_spectra(spectrum)
+            best = int(np.argmax(scores))
+            if scores[best] > 0:
+                best_tag = self._tags[best]
+                self.last_score = float(scores[best])
 
         self.last_match = best_tag
         return best_tag
 
-    def _match_spectrum(self, spectrum, reference):
-        """
-        Compare harmonic intensity alignment across known pattern.
-        """
-        min_len = min(len(spectrum), len(reference))
-        return np.dot(spectrum[:min_len], reference[:min_len]) / (
-            np.linalg.norm(spectrum[:min_len]) * np.linalg.norm(reference[:min_len]) + 1e-8
-        )
-
     def print_last_result(self):
         print(f"[Decoder] Last harmonic match: {self.last_match}")
@@ -2,38 +2,296 @@
 # High-speed photon detection + burst memory matrix
 # Author: Bryce Wooster
 
+import bisect
 import numpy as np
 import time
 
+# Compact event record: integer nanosecond timestamp + narrow spatial/phase fields (20 bytes)
+EVENT_DTYPE = np.dtype([
+    ('timestamp_ns', np.int64),
+    ('x', np.float32),
+    ('y', np.float32),
+    ('phase_tag', np.float32),
+])
+
 class PhotonEventMatrix:
     """
     High-speed data buffer for logging photon convergence events at picosecond intervals.
     Includes phase coherence tagging and energy signature mapping.
+
+    Events live in a ring of EVENT_DTYPE records (20 bytes each): once max_events
+    is reached the oldest events are overwritten. Reads return views when the
+    requested events are contiguous in the ring and copy only across the wrap
+    point; mirrored=True stores every record twice (slot i and i + max_events) so
+    reads are always views, at twice the memory. Pass backing_file to keep the
+    ring in a memory-mapped file instead of RAM.
+
+    Timestamps are kept non-decreasing, so time-window queries are binary searches:
+    each bulk block is sorted by timestamp on arrival, and events stamped earlier than
+    an event from a previous call are rejected and counted in late_events
+    (auto-generated stamps are clamped to the previous event instead).
+    With grid_bounds set, a spatial index keeps the sequence numbers of the events in
+    every coarse bucket, so region queries only visit buckets overlapping the region.
     """
 
-    def __init__(self, max_events=1000000):
+    def __init__(self, max_events=1000000, backing_file=None, grid_bounds=None, grid_shape=(32, 32),
+                 mirrored=False):
+        """
+        grid_bounds: optional (x_min, y_min, x_max, y_max) detector extent for the spatial index
+        grid_shape: (rows, cols) of coarse spatial buckets over grid_bounds
+        mirrored: store each record twice so every read is a zero-copy view
+        """
         self.max_events = max_events
-        self.event_buffer = np.zeros((max_events, 4))  # [timestamp, x, y, phase_tag]
-        self.current_index = 0
+        self.backing_file = backing_file
+        self.mirrored = mirrored
+        size = 2 * max_events if mirrored else max_events
+        if backing_file is None:
+            self.event_buffer = np.empty(size, dtype=EVENT_DTYPE)
+        else:
+            self.event_buffer = np.memmap(backing_file, dtype=EVENT_DTYPE, mode='w+', shape=(size,))
+        self.total_events = 0
+        self.late_events = 0
+        self.last_timestamp_ns = np.iinfo(np.int64).min
+        self.grid_bounds = grid_bounds
+        self.grid_shape = grid_shape
+        if grid_bounds is not None:
+            # Per bucket: growable array of event sequence numbers, live from _bucket_head
+            n_buckets = grid_shape[0] * grid_shape[1]
+            self._bucket_seqs = [np.empty(0, dtype=np.int64) for _ in range(n_buckets)]
+            self._bucket_len = np.zeros(n_buckets, dtype=np.int64)
+            self._bucket_head = np.zeros(n_buckets, dtype=np.int64)
+
+    @property
+    def current_index(self):
+        """
+        Number of events currently held in the ring.
+        """
+        return min(self.total_events, self.max_events)
 
-    def log_event(self, x, y, phase_tag):
+    def log_event(self, x, y, phase_tag, timestamp_ns=None):
         """
         Capture incoming photon event: spatial hit (x,y), harmonic phase metadata.
         """
-        if self.current_index < self.max_events:
-            self.event_buffer[self.current_index] = [
-                time.time(), x, y, phase_tag
-            ]
-            self.current_index += 1
+        if timestamp_ns is None:
+            timestamp_ns = max(time.time_ns(), self.last_timestamp_ns)
+        self.log_events(np.array([x]), np.array([y]), np.array([phase_tag]), timestamp_ns)
+
+    def log_events(self, x, y, phase_tag, timestamp_ns=None):
+        """
+        Bulk-capture photon events from arrays of hits. timestamp_ns may be an array of
+        per-event nanosecond timestamps or a scalar (defaults to the current time).
+        The block is stably sorted by timestamp before logging; events stamped before an
+        event logged by an earlier call are dropped and counted in late_events.
+        """
+        x = np.asarray(x)
+        count = x.shape[0]
+        if timestamp_ns is None:
+            timestamp_ns = max(time.time_ns(), self.last_timestamp_ns)
+        block = np.empty(count, dtype=EVENT_DTYPE)
+        block['timestamp_ns'] = timestamp_ns
+        block['x'] = x
+        block['y'] = y
+        block['phase_tag'] = phase_tag
+        if count == 0:
+            return
+        stamps = block['timestamp_ns']
+        if count > 1 and (stamps[1:] < stamps[:-1]).any():
+            # Merged detector streams arrive interleaved: order the block itself first
+            block = block[np.argsort(stamps, kind='stable')]
+            stamps = block['timestamp_ns']
+        # Late = earlier than an event logged by a previous call
+        on_time = stamps >= self.last_timestamp_ns
+        if not on_time.all():
+            self.late_events += int(count - np.count_nonzero(on_time))
+            block = block[on_time]
+            count = len(block)
+            if count == 0:
+                return
+        self.last_timestamp_ns = int(block['timestamp_ns'][-1])
+        if count > self.max_events:
+            self.total_events += count - self.max_events
+            block = block[-self.max_events:]
+            count = self.max_events
+        if self.grid_bounds is not None:
+            self._index_block(self.total_events, self._buckets(block['x'], block['y']))
+
+        # Write in at most two contiguous runs (each mirrored into the upper half if enabled)
+        start = self.total_events % self.max_events
+        first = min(count, self.max_events - start)
+        for lo, part in ((start, slice(0, first)), (0, slice(first, count))):
+            n = part.stop - part.start
+            if n:
+                for hi in ((lo, lo + self.max_events) if self.mirrored else (lo,)):
+                    self.event_buffer[hi:hi + n] = block[part]
+        self.total_events += count
+
+    def _index_block(self, first_seq, buckets):
+        """
+        Append the sequence numbers of a block of events to their bucket lists and
+        drop entries for events the ring has overwritten.
+        """
+        order = np.argsort(buckets, kind='stable')
+        touched, starts = np.unique(buckets[order], return_index=True)
+        ends = np.append(starts[1:], len(order))
+        oldest_live = first_seq + len(buckets) - self.max_events
+        for bucket, lo, hi in zip(touched.tolist(), starts.tolist(), ends.tolist()):
+            seqs, length = self._bucket_seqs[bucket], self._bucket_len[bucket]
+            head = self._bucket_head[bucket]
+            head += int(np.searchsorted(seqs[head:length], oldest_live))
+            if head > length // 2:
+                # Compact: slide live entries to the front
+                seqs[:length - head] = seqs[head:length]
+                length, head = length - head, 0
+            needed = length + hi - lo
+            if needed > len(seqs):
+                grown = np.empty(max(needed, 2 * len(seqs), 64), dtype=np.int64)
+                grown[:length] = seqs[:length]
+                seqs = self._bucket_seqs[bucket] = grown
+            seqs[length:needed] = first_seq + order[lo:hi]
+            self._bucket_len[bucket], self._bucket_head[bucket] = needed, head
+
+    def _buckets(self, x, y):
+        """
+        Coarse spatial bucket id (row * cols + col) for each hit; off-grid hits clip to the edge.
+        """
+        x_min, y_min, x_max, y_max = self.grid_bounds
+        rows, cols = self.grid_shape
+        col = np.clip(((x - x_min) * (cols / (x_max - x_min))).astype(np.int64), 0, cols - 1)
+        row = np.clip(((y - y_min) * (rows / (y_max - y_min))).astype(np.int64), 0, rows - 1)
+        return (row * cols + col).astype(np.int32)
+
+    def _segments(self, lo=0, hi=None):
+        """
+        Physical ring slices covering held events [lo, hi) (0 = oldest held), as
+        (slice, logical offset) pairs; one pair unless the range crosses the wrap point.
+        """
+        held = self.current_index
+        hi = held if hi is None else min(hi, held)
+        lo = min(lo, hi)
+        n = hi - lo
+        start = (self.total_events - held + lo) % self.max_events
+        if self.mirrored or start + n <= self.max_events:
+            return [(slice(start, start + n), lo)]
+        split = self.max_events - start
+        return [(slice(start, self.max_events), lo), (slice(0, n - split), lo + split)]
+
+    def _gather(self, column, lo=0, hi=None):
+        """
+        Held events (or one per-event column) [lo, hi): a view unless the range wraps.
+        """
+        parts = [column[part] for part, _ in self._segments(lo, hi)]
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def held_events(self):
+        """
+        Every event currently held, oldest first (a view unless the ring has wrapped
+        mid-range). The index arrays returned by the query_* methods refer to
+        positions in this sequence.
+        """
+        return self._gather(self.event_buffer)
 
     def get_recent_events(self, count=100):
         """
         Retrieve most recent photon convergence events for processing pipeline.
+        Returns EVENT_DTYPE records, oldest first. With the default single ring this is
+        a view into the buffer only while the requested events are contiguous; once they
+        straddle the wrap point they are copied (count records). Construct the matrix
+        with mirrored=True when this read must always be zero-copy.
+        """
+        held = self.current_index
+        return self._gather(self.event_buffer, held - min(count, held))
+
+    def time_window(self, start_ns=None, end_ns=None):
+        """
+        Positions [lo, hi) in held_events() of events with start_ns <= timestamp < end_ns,
+        found by binary search on the monotonic timestamp column (per ring segment).
+        """
+        segments = [(self.event_buffer['timestamp_ns'][part], offset) for part, offset in self._segments()]
+
+        def position(stamp):
+            for stamps, offset in segments:
+                if len(stamps) and stamp <= stamps[-1]:
+                    # bisect probes the strided column in place (np.searchsorted would copy it)
+                    return offset + bisect.bisect_left(stamps, stamp)
+            return self.current_index
+
+        lo = 0 if start_ns is None else position(start_ns)
+        hi = self.current_index if end_ns is None else position(end_ns)
+        return lo, max(lo, hi)
+
+    def query_time_range(self, start_ns=None, end_ns=None):
+        """
+        Events with start_ns <= timestamp < end_ns (a view unless the range wraps).
+        """
+        lo, hi = self.time_window(start_ns, end_ns)
+        return self._gather(self.event_buffer, lo, hi)
+
+    def query_region(self, x_min, y_min, x_max, y_max, start_ns=None, end_ns=None):
+        """
+        Indices into held_events() of hits inside [x_min, x_max) x [y_min, y_max),
+        optionally restricted to a time window. Only buckets overlapping the rectangle
+        are visited: hits in buckets wholly inside are accepted without touching
+        coordinates, and only border buckets are refined.
+        """
+        lo, hi = self.time_window(start_ns, end_ns)
+
+        def inside(ev):
+            return (ev['x'] >= x_min) & (ev['x'] < x_max) & (ev['y'] >= y_min) & (ev['y'] < y_max)
+
+        if self.grid_bounds is None:
+            return lo + np.flatnonzero(inside(self._gather(self.event_buffer, lo, hi)))
+
+        # 2 = bucket fully inside the rectangle, 1 = bucket straddles its border
+        gx_min, gy_min, gx_max, gy_max = self.grid_bounds
+        rows, cols = self.grid_shape
+        cw, ch = (gx_max - gx_min) / cols, (gy_max - gy_min) / rows
+        c_lo, r_lo = gx_min + np.arange(cols) * cw, gy_min + np.arange(rows) * ch
+        col_state = np.where((c_lo >= x_min) & (c_lo + cw <= x_max), 2, (c_lo < x_max) & (c_lo + cw > x_min))
+        row_state = np.where((r_lo >= y_min) & (r_lo + ch <= y_max), 2, (r_lo < y_max) & (r_lo + ch > y_min))
+        # Edge buckets also hold clipped off-grid hits, so they always need refinement
+        col_state[[0, -1]] = np.minimum(col_state[[0, -1]], 1)
+        row_state[[0, -1]] = np.minimum(row_state[[0, -1]], 1)
+        state = np.minimum.outer(row_state, col_state).astype(np.int8)
+        if x_min < gx_min or x_max > gx_max or y_min < gy_min or y_max > gy_max:
+            state[[0, -1], :] = np.maximum(state[[0, -1], :], 1)
+            state[:, [0, -1]] = np.maximum(state[:, [0, -1]], 1)
+
+        # Gather candidate sequence numbers per bucket (each list is sorted)
+        oldest = self.total_events - self.current_index
+        seq_lo, seq_hi = oldest + lo, oldest + hi
+        visited = np.flatnonzero(state.ravel())
+        live = self._bucket_len - self._bucket_head
+        if live[visited].sum() * 4 > max(live.sum(), 1):
+            # Region covers much of the detector: one linear scan beats merging bucket lists
+            return lo + np.flatnonzero(inside(self._gather(self.event_buffer, lo, hi)))
+        picked = {1: [], 2: []}
+        for bucket in visited.tolist():
+            seqs = self._bucket_seqs[bucket][self._bucket_head[bucket]:self._bucket_len[bucket]]
+            a, b = np.searchsorted(seqs, (seq_lo, seq_hi))
+            if b > a:
+                picked[int(state.flat[bucket])].append(seqs[a:b])
+        full = np.concatenate(picked[2]) if picked[2] else np.empty(0, dtype=np.int64)
+        border = np.concatenate(picked[1]) if picked[1] else np.empty(0, dtype=np.int64)
+        # Physical slot of sequence number s is s % max_events (also in the mirrored layout)
+        border = border[inside(self.event_buffer[border % self.max_events])]
+        return np.sort(np.concatenate([full, border])) - oldest
+
+    def query_phase(self, phase_tag, start_ns=None, end_ns=None):
+        """
+        Indices into held_events() of events carrying `phase_tag`, optionally within a time window.
+        """
+        lo, hi = self.time_window(start_ns, end_ns)
+        phases = self._gather(self.event_buffer['phase_tag'], lo, hi)
+        return lo + np.flatnonzero(phases == np.float32(phase_tag))
+
+    def flush(self):
+        """
+        Push a memory-mapped ring out to its backing file.
         """
-        start_idx = max(0, self.current_index - count)
-        return self.event_buffer[start_idx:self.current_index]
+        if isinstance(self.event_buffer, np.memmap):
+            self.event_buffer.flush()
 
     def summarize(self):
-        print(f"[PhotonMatrix] {self.current_index} events logged")
-        if self.current_index > 0:
-            print(f"Last event: {self.event_buffer[self.current_index - 1]}")
+        print(f"[PhotonMatrix] {self.current_index} events held ({self.total_events} logged)")
+        if self.total_events > 0:
+            print(f"Last event: {self.get_recent_events(1)[0]}")
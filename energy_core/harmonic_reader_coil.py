@@ -4,19 +4,27 @@
 
 import numpy as np
 
+HARMONIC_BINS = (3, 6, 9)
+
 class HarmonicReaderCoil:
     """
     Reads photonic phase shifts and energy flux from the photon trap,
     translating them into measurable signal voltages with harmonic tagging.
+    Only the 3rd, 6th and 9th Fourier bins are evaluated (small DFT matrix
+    product), and readouts are kept in a bounded ring of typed arrays.
     """
 
-    def __init__(self, turns=369, coil_diameter_mm=42, wire_diameter_mm=0.4):
+    def __init__(self, turns=369, coil_diameter_mm=42, wire_diameter_mm=0.4, history_size=4096):
         self.turns = turns
         self.coil_diameter_mm = coil_diameter_mm
         self.wire_diameter_mm = wire_diameter_mm
         self.inductance_nH = self._calculate_inductance()
         self.phase_resolution = 0.003  # radians
-        self.data_buffer = []
+        self.history_size = history_size
+        self.amplitude_history = np.zeros((history_size, len(HARMONIC_BINS)))
+        self.phase_history = np.zeros((history_size, len(HARMONIC_BINS)))
+        self.readout_count = 0
+        self._basis_cache = (None, None)  # (waveform length, basis) of the last length seen
 
     def _calculate_inductance(self):
         """
@@ -28,45 +36,98 @@ class HarmonicReaderCoil:
         inductance = (r ** 2 * l ** 2) / (9 * r + 10 * d)
         return inductance * 1e3  # convert to nH
 
+    def _dft_basis(self, n):
+        """
+        (n, len(HARMONIC_BINS)) DFT columns for the harmonic bins, cached for the last
+        waveform length. Waveforms must be longer than the highest bin; shorter ones
+        would alias the bins onto each other.
+        """
+        if n <= max(HARMONIC_BINS):
+            raise IndexError(f"Waveform of {n} samples has no bin {max(HARMONIC_BINS)}; "
+                             f"need at least {max(HARMONIC_BINS) + 1} samples")
+        cached_n, basis = self._basis_cache
+        if cached_n != n:
+            t = np.arange(n)[:, None]
+            basis = np.exp(-2j * np.pi * t * np.array(HARMONIC_BINS) / n)
+            self._basis_cache = (n, basis)
+        return basis
+
+    def _record(self, amplitudes, phases):
+        """
+        Write a (batch, bins) block of readouts into the history ring.
+        """
+        count = len(amplitudes)
+        if count > self.history_size:
+            amplitudes, phases = amplitudes[-self.history_size:], phases[-self.history_size:]
+            self.readout_count += count - self.history_size
+            count = self.history_size
+        slots = (self.readout_count + np.arange(count)) % self.history_size
+        self.amplitude_history[slots] = amplitudes
+        self.phase_history[slots] = phases
+        self.readout_count += count
+
     def feed_photon_flux(self, incoming_waveform: np.ndarray):
         """
         Accepts waveform from photon trap throat, assumes input is in
         time-domain energy pulses. Performs Fourier harmonic deconstruction.
         """
-        harmonic_spectrum = np.fft.fft(incoming_waveform)
+        harmonic_spectrum = np.asarray(incoming_waveform) @ self._dft_basis(len(incoming_waveform))
         amplitudes = np.abs(harmonic_spectrum)
         phases = np.angle(harmonic_spectrum)
 
         # Extract dominant harmonic regions for 3-6-9 Tesla structuring
         harmonic_payload = self._extract_harmonics(amplitudes, phases)
-        self.data_buffer.append(harmonic_payload)
+        self._record(amplitudes[None, :], phases[None, :])
 
         return harmonic_payload
 
+    def feed_photon_flux_batch(self, waveforms: np.ndarray):
+        """
+        Accepts a (batch, samples) stack of waveforms and deconstructs all of them in
+        one matrix product. Returns a payload whose amplitude/phase entries are arrays
+        of length batch (EchoDecoderMatrix.ingest_batch accepts it directly).
+        """
+        waveforms = np.atleast_2d(waveforms)
+        harmonic_spectrum = waveforms @ self._dft_basis(waveforms.shape[1])
+        amplitudes = np.abs(harmonic_spectrum)
+        phases = np.angle(harmonic_spectrum)
+        self._record(amplitudes, phases)
+        return self._extract_harmonics(amplitudes.T, phases.T)
+
     def _extract_harmonics(self, amplitudes, phases):
         """
-        Pull harmonic keys from 3rd, 6th, and 9th Fourier bins
-        """
-        result = {
-            "harmonic_3": {
-                "amplitude": amplitudes[3],
-                "phase": phases[3]
-            },
-            "harmonic_6": {
-                "amplitude": amplitudes[6],
-                "phase": phases[6]
-            },
-            "harmonic_9": {
-                "amplitude": amplitudes[9],
-                "phase": phases[9]
+        Pull harmonic keys from the 3rd, 6th, and 9th Fourier bins
+        (amplitudes/phases are indexed in HARMONIC_BINS order)
+        """
+        result = {}
+        for i, h in enumerate(HARMONIC_BINS):
+            result[f"harmonic_{h}"] = {
+                "amplitude": amplitudes[i],
+                "phase": phases[i]
             }
-        }
         return result
 
     def clear_buffer(self):
-        self.data_buffer.clear()
+        self.readout_count = 0
+
+    def get_history(self):
+        """
+        Retained readouts in chronological order as (amplitudes, phases) arrays.
+        """
+        count = min(self.readout_count, self.history_size)
+        slots = (self.readout_count - count + np.arange(count)) % self.history_size
+        return self.amplitude_history[slots], self.phase_history[slots]
+
+    @property
+    def data_buffer(self):
+        """
+        Retained readouts as a list of payload dicts (compatibility view).
+        """
+        amplitudes, phases = self.get_history()
+        return [self._extract_harmonics(a, p) for a, p in zip(amplitudes, phases)]
 
     def get_latest_readout(self):
-        if not self.data_buffer:
+        if self.readout_count == 0:
             return None
-        return self.data_buffer[-1]
+        slot = (self.readout_count - 1) % self.history_size
+        return self._extract_harmonics(self.amplitude_history[slot], self.phase_history[slot])
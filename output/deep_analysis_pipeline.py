@@ -2,52 +2,235 @@
 # Advanced real-time inference pipeline for harmonic signal interpretation
 # Author: Bryce Wooster
 
+import os
+import threading
+import time
 import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from output.harmonic_image_reconstructor import HarmonicImageReconstructor
-from output.signature_decoder import HarmonicSignatureDecoder
-from sklearn.cluster import KMeans
+from detectors.harmonic_signature_decoder import HarmonicSignatureDecoder
 import logging
 
+class StreamingCentroids:
+    """
+    Online k-means over a stream of feature vectors.
+    The first n_clusters samples seed the centroids; afterwards every sample (or
+    mini-batch) pulls its nearest centroid toward it with a 1/count learning rate,
+    so the model keeps learning without storing samples or refitting. min_rate > 0
+    puts a floor under the learning rate, letting centroids follow a drifting signal.
+    """
+
+    def __init__(self, n_clusters=4, min_rate=0.0):
+        self.n_clusters = n_clusters
+        self.min_rate = min_rate
+        self.centroids = None
+        self.counts = np.zeros(n_clusters, dtype=np.int64)
+        self.seeded = 0
+
+    def predict(self, features):
+        """
+        Nearest-centroid labels for a (n, dim) block of features.
+        """
+        features = np.atleast_2d(features)
+        active = self.centroids[:self.seeded]
+        # ||x - c||^2 = ||x||^2 - 2 x.c + ||c||^2; ||x||^2 is constant per row
+        distances = np.einsum('ij,ij->i', active, active) - 2.0 * features @ active.T
+        return np.argmin(distances, axis=1)
+
+    def partial_fit_predict(self, features):
+        """
+        Label a (n, dim) block of features, then fold it into the centroids.
+        Returns the labels assigned before the update.
+        """
+        features = np.atleast_2d(np.asarray(features, dtype=np.float64))
+        if self.centroids is None:
+            self.centroids = np.zeros((self.n_clusters, features.shape[1]))
+        labels = np.empty(len(features), dtype=np.int64)
+
+        # Seed empty centroids from the first samples seen
+        seed = min(self.n_clusters - self.seeded, len(features))
+        if seed:
+            self.centroids[self.seeded:self.seeded + seed] = features[:seed]
+            labels[:seed] = np.arange(self.seeded, self.seeded + seed)
+            self.counts[self.seeded:self.seeded + seed] = 1
+            self.seeded += seed
+        rest = features[seed:]
+        if not len(rest):
+            return labels
+
+        labels[seed:] = self.predict(rest)
+        batch_counts = np.bincount(labels[seed:], minlength=self.n_clusters)
+        sums = np.zeros_like(self.centroids)
+        np.add.at(sums, labels[seed:], rest)
+        hit = batch_counts > 0
+        self.counts[hit] += batch_counts[hit]
+        rate = np.maximum(batch_counts[hit] / self.counts[hit], self.min_rate)
+        batch_means = sums[hit] / batch_counts[hit, None]
+        self.centroids[hit] += rate[:, None] * (batch_means - self.centroids[hit])
+        return labels
+
+# Per-process pipeline used by analyze_batch(executor='process') workers
+_worker_pipeline = None
+
+def _init_batch_worker(resolution, smoothing, dtype, feature_mode, feature_size):
+    global _worker_pipeline
+    _worker_pipeline = DeepAnalysisPipeline(resolution=resolution, feature_mode=feature_mode,
+                                            feature_size=feature_size, history_size=0)
+    _worker_pipeline.reconstructor.smoothing = smoothing
+    _worker_pipeline.reconstructor.dtype = dtype
+
+def _batch_worker(encoded_signal):
+    return _worker_pipeline._signal_features(encoded_signal)
+
 class DeepAnalysisPipeline:
     """
     Central analyzer that receives raw harmonic signal vectors, reconstructs visualizations,
     and performs pattern clustering for unknown signal classification or anomaly detection.
+
+    Images are reduced to a compact feature vector (block-averaged thumbnail or
+    radial intensity profile) and clustered online by StreamingCentroids, so the
+    pipeline learns continuously from a live stream. history is bounded to
+    history_size (label, features) pairs.
     """
 
-    def __init__(self, resolution=(256, 256), cluster_count=4):
+    def __init__(self, resolution=(256, 256), cluster_count=4, feature_mode='downsample',
+                 feature_size=16, history_size=1024, min_rate=0.0):
+        """
+        feature_mode: 'downsample' (feature_size x feature_size block means) or
+                      'radial' (feature_size-bin radial profile about the image centre)
+        history_size: number of recent (label, features) pairs kept in history
+        min_rate: learning-rate floor for the streaming centroids (0 = plain running means)
+        """
         self.decoder = HarmonicSignatureDecoder()
         self.reconstructor = HarmonicImageReconstructor(resolution=resolution)
-        self.cluster_model = KMeans(n_clusters=cluster_count)
-        self.history = []
+        self.cluster_model = StreamingCentroids(n_clusters=cluster_count, min_rate=min_rate)
+        self.feature_mode = feature_mode
+        self.feature_size = feature_size
+        self.history = deque(maxlen=history_size)
+        self._radial_bins = None
+        self._buffers = threading.local()
         logging.basicConfig(level=logging.INFO)
 
+    def _image_buffer(self):
+        """
+        Per-thread reconstruction buffer; features are taken before it is reused.
+        """
+        buffer = getattr(self._buffers, 'image', None)
+        if buffer is None or buffer.shape != tuple(self.reconstructor.resolution):
+            buffer = np.empty(self.reconstructor.resolution, dtype=self.reconstructor.dtype)
+            self._buffers.image = buffer
+        return buffer
+
+    def extract_features(self, image):
+        """
+        Reduce a reconstructed image to the compact feature vector used for clustering.
+        """
+        h, w = image.shape
+        n = self.feature_size
+        if self.feature_mode == 'radial':
+            if self._radial_bins is None or self._radial_bins[0].shape != image.shape:
+                yy, xx = np.indices(image.shape)
+                radius = np.hypot(yy - (h - 1) / 2.0, xx - (w - 1) / 2.0)
+                bins = np.minimum((radius / (radius.max() + 1e-9) * n).astype(np.int64), n - 1).ravel()
+                self._radial_bins = (bins.reshape(image.shape), np.bincount(bins, minlength=n))
+            bins, counts = self._radial_bins
+            return np.bincount(bins.ravel(), weights=image.ravel(), minlength=n) / np.maximum(counts, 1)
+
+        # Block means over an n x n grid (edge blocks absorb any remainder)
+        rows = np.linspace(0, h, n + 1).astype(np.int64)[:-1]
+        cols = np.linspace(0, w, n + 1).astype(np.int64)[:-1]
+        sums = np.add.reduceat(np.add.reduceat(image, rows, axis=0), cols, axis=1)
+        areas = np.outer(np.diff(np.append(rows, h)), np.diff(np.append(cols, w)))
+        return (sums / areas).ravel()
+
     def analyze(self, encoded_signal):
         """
         Full signal-to-image-to-cluster pipeline.
         Decodes signal, generates image, and classifies based on internal feature space.
+        encoded_signal: photon events (PhotonEventMatrix records or rows led by arrival time)
         """
-        decoded = self.decoder.decode(encoded_signal)
-        image = self.reconstructor.generate_image(decoded)
+        decoded = self.decoder.compute_spectrum(np.asarray(encoded_signal))
+        image = self.reconstructor.generate_image(decoded, out=self._image_buffer())
 
         if image is None:
             logging.warning("Failed to generate harmonic image.")
             return None
 
-        # Flatten image to feature vector for clustering
-        flat_img = image.flatten().reshape(1, -1)
-        try:
-            label = self.cluster_model.predict(flat_img)[0]
-        except Exception:
-            # Initial fit if model hasn't been trained
-            self.cluster_model.fit(flat_img)
-            label = self.cluster_model.predict(flat_img)[0]
+        features = self.extract_features(image)
+        label = int(self.cluster_model.partial_fit_predict(features)[0])
 
-        self.history.append((label, flat_img))
+        self.history.append((label, features))
         logging.info(f"[DeepAnalysis] Signal clustered into group: {label}")
         return label
 
+    def _signal_features(self, encoded_signal):
+        """
+        Decode -> reconstruct -> feature stage for one signal (runs inside the worker pool).
+        Returns (features or None, per-stage seconds).
+        """
+        t0 = time.perf_counter()
+        decoded = self.decoder.compute_spectrum(np.asarray(encoded_signal))
+        t1 = time.perf_counter()
+        image = self.reconstructor.generate_image(decoded, out=self._image_buffer())
+        t2 = time.perf_counter()
+        features = None if image is None else self.extract_features(image)
+        t3 = time.perf_counter()
+        return features, (t1 - t0, t2 - t1, t3 - t2)
+
+    def analyze_batch(self, encoded_signals, workers=None, executor='process', learn=True):
+        """
+        Analyze many signals at once. Decoding and image reconstruction run across a
+        pool of `workers` (default: all cores) processes, or threads with
+        executor='thread', then the whole batch is clustered in one vectorized step.
+        learn=False only predicts against the current centroids (they must be seeded).
+        Returns: (labels in input order, -1 where no image could be generated,
+                  timings dict of per-stage seconds summed over signals plus wall-clock totals)
+        """
+        start = time.perf_counter()
+        encoded_signals = list(encoded_signals)
+        workers = min(workers or os.cpu_count() or 1, len(encoded_signals))
+        if workers <= 1:
+            results = [self._signal_features(signal) for signal in encoded_signals]
+        elif executor == 'thread':
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(self._signal_features, encoded_signals))
+        else:
+            init_args = (self.reconstructor.resolution, self.reconstructor.smoothing,
+                         self.reconstructor.dtype, self.feature_mode, self.feature_size)
+            chunksize = max(1, len(encoded_signals) // (4 * workers))
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                                     initargs=init_args) as pool:
+                results = list(pool.map(_batch_worker, encoded_signals, chunksize=chunksize))
+        stage_times = np.sum([r[1] for r in results], axis=0) if results else np.zeros(3)
+        reconstructed = time.perf_counter()
+
+        labels = np.full(len(results), -1, dtype=np.int64)
+        valid = [i for i, (features, _) in enumerate(results) if features is not None]
+        if len(valid) < len(results):
+            logging.warning(f"Failed to generate harmonic image for {len(results) - len(valid)} signal(s).")
+        if valid:
+            features = np.vstack([results[i][0] for i in valid])
+            if learn:
+                labels[valid] = self.cluster_model.partial_fit_predict(features)
+            else:
+                labels[valid] = self.cluster_model.predict(features)
+            self.history.extend(zip(labels[valid].tolist(), features))
+        done = time.perf_counter()
+
+        timings = {
+            'decode': float(stage_times[0]),
+            'reconstruct': float(stage_times[1]),
+            'features': float(stage_times[2]),
+            'pool_wall': reconstructed - start,
+            'cluster': done - reconstructed,
+            'total': done - start,
+        }
+        logging.info(f"[DeepAnalysis] Batch of {len(labels)} signals clustered in {timings['total']:.3f}s")
+        return labels, timings
+
     def visualize_last(self):
         self.reconstructor.display_last_image()
 
     def get_history(self):
-        return self.history
+        return list(self.history)
@@ -10,33 +10,80 @@ class HarmonicImageReconstructor:
     """
     Reconstructs visual representations of harmonic signals.
     Converts frequency-domain encoded data (from decoder) into 2D or 3D harmonic image maps.
+
+    A signature vector fills only its first rows of the grid, and every row more than
+    one kernel radius below it stays exactly zero after smoothing. So only the
+    populated rows plus that margin are filtered, directly inside the output buffer
+    (identical to filtering the whole grid). Pass `out` to reuse preallocated
+    buffers; dtype=np.float32 halves memory traffic.
     """
 
-    def __init__(self, resolution=(256, 256), smoothing=1.5):
+    def __init__(self, resolution=(256, 256), smoothing=1.5, dtype=np.float64):
         self.resolution = resolution
         self.smoothing = smoothing
+        self.dtype = np.dtype(dtype)
         self.last_image = None
 
-    def generate_image(self, signature_vector):
+    def _filtered_rows(self, length):
+        """
+        Rows that can be non-zero after smoothing a vector of `length` values.
+        """
+        populated = -(-length // self.resolution[1])
+        radius = int(4.0 * self.smoothing + 0.5)  # gaussian_filter's default truncate
+        return min(self.resolution[0], populated + radius)
+
+    def generate_image(self, signature_vector, out=None):
         """
         Transforms harmonic frequency array into an interpretable visual field.
         Uses simple reshaping and filtering to reveal spatial phase formations.
+        out: optional preallocated C-contiguous array of shape `resolution` to fill
         """
         if signature_vector is None or len(signature_vector) == 0:
             return None
 
-        # Normalize and reshape the vector into a 2D grid
-        vector = np.array(signature_vector)
-        vector = (vector - np.min(vector)) / (np.max(vector) - np.min(vector) + 1e-9)
+        if out is None:
+            out = np.empty(self.resolution, dtype=self.dtype)
+        vector = np.asarray(signature_vector)
+        min_len = min(vector.shape[0], out.size)
+        rows = self._filtered_rows(min_len)
 
-        padded = np.zeros(self.resolution)
-        min_len = min(vector.shape[0], np.prod(self.resolution))
-        padded.flat[:min_len] = vector[:min_len]
+        # Normalize the vector straight into the grid and clear the rest
+        low, high = np.min(vector), np.max(vector)
+        flat = out.reshape(-1)
+        np.subtract(vector[:min_len], low, out=flat[:min_len], casting='unsafe')
+        flat[:min_len] *= 1.0 / (high - low + 1e-9)
+        flat[min_len:] = 0.0
 
         # Smooth to simulate natural field distortion
-        image = gaussian_filter(padded, sigma=self.smoothing)
-        self.last_image = image
-        return image
+        gaussian_filter(out[:rows], sigma=self.smoothing, output=out[:rows])
+        self.last_image = out
+        return out
+
+    def generate_images(self, signature_vectors, out=None):
+        """
+        Reconstruct a stack of equal-length signature vectors (n, length) in one pass.
+        out: optional preallocated (n,) + resolution array to fill
+        """
+        vectors = np.atleast_2d(np.asarray(signature_vectors))
+        n = vectors.shape[0]
+        if out is None:
+            out = np.empty((n,) + tuple(self.resolution), dtype=self.dtype)
+        if n == 0 or vectors.shape[1] == 0:
+            return out
+        min_len = min(vectors.shape[1], out[0].size)
+        rows = self._filtered_rows(min_len)
+
+        low = vectors.min(axis=1, keepdims=True)
+        scale = 1.0 / (vectors.max(axis=1, keepdims=True) - low + 1e-9)
+        flat = out.reshape(n, -1)
+        np.subtract(vectors[:, :min_len], low, out=flat[:, :min_len], casting='unsafe')
+        flat[:, :min_len] *= scale
+        flat[:, min_len:] = 0.0
+
+        # sigma 0 along the stack axis: each image is smoothed independently
+        gaussian_filter(out[:, :rows], sigma=(0, self.smoothing, self.smoothing), output=out[:, :rows])
+        self.last_image = out[-1]
+        return out
 
     def display_last_image(self, cmap="plasma"):
         if self.last_image is None:
@@ -3,7 +3,118 @@
 # Author: Bryce Wooster
 
 import numpy as np
-from scipy.fft import fft, fftfreq
+from scipy import ndimage
+from scipy.fft import fft, rfft, fftfreq, rfftfreq
+
+# One record per connected anomalous region (8-connected pixels)
+REGION_DTYPE = np.dtype([
+    ('row_min', np.int32), ('row_max', np.int32),
+    ('col_min', np.int32), ('col_max', np.int32),
+    ('pixel_count', np.int64),
+    ('peak_row', np.int32), ('peak_col', np.int32),
+    ('peak_value', np.float64),
+])
+
+class PixelBaseline:
+    """
+    Per-pixel running mean and variance of time-domain frames, updated in place.
+    With alpha=None every frame counts equally (Welford); otherwise the statistics
+    decay exponentially with weight alpha on the newest frame.
+    """
+
+    def __init__(self, alpha=None):
+        self.alpha = alpha
+        self.count = 0
+        self.mean = None
+        self.var_sum = None
+        self._delta = None
+
+    def update(self, frame):
+        frame = np.asarray(frame)
+        if self.mean is None or self.mean.shape != frame.shape:
+            self.mean = frame.astype(np.float64)
+            self.var_sum = np.zeros(frame.shape)
+            self._delta = np.empty(frame.shape)
+            self.count = 1
+            return
+        self.count += 1
+        delta = np.subtract(frame, self.mean, out=self._delta)
+        if self.alpha is None:
+            self.mean += delta / self.count
+            # var_sum += delta * (frame - new_mean), reusing the delta buffer
+            delta *= frame - self.mean
+            self.var_sum += delta
+        else:
+            self.mean += self.alpha * delta
+            delta *= delta
+            delta *= self.alpha
+            self.var_sum += delta
+            self.var_sum *= 1.0 - self.alpha
+
+    @property
+    def std(self):
+        if self.var_sum is None:
+            return None
+        if self.alpha is None:
+            return np.sqrt(self.var_sum / max(self.count - 1, 1))
+        return np.sqrt(self.var_sum)
+
+class SpectrogramAccumulator:
+    """
+    Running short-time spectral statistics of wavefront rows.
+    Holds the sum of windowed magnitude spectra per frame (time-frequency map) and
+    the number of rows folded in, so averages are available at any point while
+    blocks are still streaming in.
+    """
+
+    def __init__(self, n_frames, window, hop, sample_rate_thz, onesided=True, keep_map=True):
+        self.window = window
+        self.hop = hop
+        self.sample_rate_thz = sample_rate_thz
+        self.onesided = onesided
+        n_bins = window // 2 + 1 if onesided else window
+        self.frame_sum = np.zeros((n_frames, n_bins)) if keep_map else None
+        self.spectrum_sum = np.zeros(n_bins)
+        self.frame_rows = np.zeros(n_frames, dtype=np.int64)
+
+    def add(self, magnitudes, first_frame):
+        """
+        Fold (rows, frames, bins) magnitudes for frames starting at first_frame.
+        """
+        rows, frames = magnitudes.shape[:2]
+        per_frame = magnitudes.sum(axis=0)
+        if self.frame_sum is not None:
+            self.frame_sum[first_frame:first_frame + frames] += per_frame
+        self.spectrum_sum += per_frame.sum(axis=0)
+        self.frame_rows[first_frame:first_frame + frames] += rows
+
+    @property
+    def freqs(self):
+        d = 1 / self.sample_rate_thz
+        return rfftfreq(self.window, d=d) if self.onesided else fftfreq(self.window, d=d)
+
+    @property
+    def times(self):
+        """
+        Centre of each frame, in 1 / sample_rate_thz units (ps).
+        """
+        return (np.arange(len(self.frame_rows)) * self.hop + self.window / 2) / self.sample_rate_thz
+
+    @property
+    def time_frequency_map(self):
+        """
+        Row-averaged magnitude spectrum of every frame, shaped (frames, bins).
+        """
+        if self.frame_sum is None:
+            return None
+        return self.frame_sum / np.maximum(self.frame_rows, 1)[:, None]
+
+    @property
+    def average_spectrum(self):
+        """
+        Magnitude spectrum averaged over every row and frame seen so far.
+        """
+        return self.spectrum_sum / max(int(self.frame_rows.sum()), 1)
 
 class TimeSeriesDecoder:
     """
@@ -13,25 +124,57 @@ class TimeSeriesDecoder:
 
     def __init__(self, sample_rate_thz=1.0):
         self.sample_rate_thz = sample_rate_thz  # Sampling in terahertz (light-relevant)
+        self.baseline = None  # PixelBaseline for adaptive anomaly detection, created on first use
 
-    def decode(self, complex_wavefront_matrix):
+    def decode(self, complex_wavefront_matrix, workers=None, freq_out=None, time_out=None, block_rows=256):
         """
         Processes a 2D array of complex-valued phase data and performs
         temporal reconstruction via FFT for each spatial axis.
+
+        All rows are transformed by axis-wise FFTs (`workers` threads, in blocks of
+        block_rows when writing into freq_out). Real input takes the rfft path and
+        fills the upper half of each spectrum by Hermitian symmetry. The inverse
+        transform of the spectrum is the input itself, so time_domain_data is its real
+        part: copied into time_out if given, otherwise a read-only view.
+        Returns: (freq_data, time_domain_data, dominant_freqs) with the per-row
+        frequency (THz) of the strongest spectral bin.
         """
-        rows, cols = complex_wavefront_matrix.shape
-        freq_data = np.zeros((rows, cols), dtype=np.complex128)
-        time_domain_data = np.zeros((rows, cols))
+        data = np.asarray(complex_wavefront_matrix)
+        rows, cols = data.shape
+        real_input = not np.iscomplexobj(data)
+        dominant_index = np.empty(rows, dtype=np.int64)
 
-        for r in range(rows):
-            row_signal = complex_wavefront_matrix[r, :]
-            fft_result = fft(row_signal)
-            freqs = fftfreq(len(row_signal), d=1 / self.sample_rate_thz)
-            dominant_freq_index = np.argmax(np.abs(fft_result))
-            freq_data[r, :] = fft_result
-            time_domain_data[r, :] = np.real(np.fft.ifft(fft_result))
+        if freq_out is None and not real_input:
+            freq_out = fft(data, axis=1, workers=workers)
+            for start in range(0, rows, block_rows):
+                dominant_index[start:start + block_rows] = np.argmax(np.abs(freq_out[start:start + block_rows]), axis=1)
+        else:
+            if freq_out is None:
+                freq_out = np.empty((rows, cols), dtype=np.complex128)
+            half = cols // 2 + 1
+            for start in range(0, rows, block_rows):
+                block = data[start:start + block_rows]
+                dest = freq_out[start:start + block_rows]
+                if real_input:
+                    spectrum = rfft(block, axis=1, workers=workers)
+                    dest[:, :half] = spectrum
+                    # X[n - k] = conj(X[k]) for real signals
+                    np.conjugate(spectrum[:, 1:cols - half + 1][:, ::-1], out=dest[:, half:])
+                else:
+                    spectrum = fft(block, axis=1, workers=workers)
+                    dest[:] = spectrum
+                dominant_index[start:start + block_rows] = np.argmax(np.abs(spectrum), axis=1)
 
-        return freq_data, time_domain_data
+        dominant_freqs = fftfreq(cols, d=1 / self.sample_rate_thz)[dominant_index]
+
+        if time_out is not None:
+            np.copyto(time_out, data.real)
+            time_domain_data = time_out
+        else:
+            time_domain_data = data.real.view()
+            time_domain_data.flags.writeable = False
+
+        return freq_out, time_domain_data, dominant_freqs
 
     def extract_spectral_signature(self, freq_data):
         """
@@ -40,10 +183,113 @@ class TimeSeriesDecoder:
         magnitude_spectrum = np.abs(freq_data)
         return np.mean(magnitude_spectrum, axis=0)
 
-    def detect_anomalies(self, time_domain_data, threshold=0.5):
+    def detect_anomalies(self, time_domain_data, threshold=0.5, output='coords', adaptive=False,
+                         k_sigma=4.0, min_frames=30, max_regions=None):
         """
         Detects any signal deviation indicative of photon curvature shifts,
         source pulse distortion, or lens artifacts.
+
+        adaptive=True flags pixels deviating more than k_sigma running standard
+        deviations from their running mean (self.baseline, updated with each frame);
+        the fixed |value| > threshold rule applies until min_frames have been seen
+        (a standard deviation estimated from only a few frames flags far too many pixels).
+        output: 'coords' -> (row_indices, col_indices) arrays
+                'regions' -> REGION_DTYPE records (bounding box, pixel count, peak),
+                             strongest first, at most max_regions
+                'list' -> legacy list of (row, col) tuples
         """
-        anomalies = np.where(np.abs(time_domain_data) > threshold)
-        return list(zip(anomalies[0], anomalies[1]))
+        data = np.asarray(time_domain_data)
+        if adaptive:
+            if self.baseline is None:
+                self.baseline = PixelBaseline()
+            baseline = self.baseline
+            if baseline.count >= min_frames and baseline.mean.shape == data.shape:
+                deviation = np.abs(data - baseline.mean)
+                mask = deviation > k_sigma * baseline.std
+            else:
+                deviation = np.abs(data)
+                mask = deviation > threshold
+            baseline.update(data)
+        else:
+            deviation = np.abs(data)
+            mask = deviation > threshold
+
+        if output == 'regions':
+            return self._anomaly_regions(mask, deviation, max_regions)
+        anomalies = np.nonzero(mask)
+        if output == 'list':
+            return list(zip(anomalies[0], anomalies[1]))
+        return anomalies
+
+    @staticmethod
+    def _anomaly_regions(mask, deviation, max_regions=None):
+        """
+        Summarize 8-connected anomalous regions of `mask`, ranked by peak deviation.
+        """
+        labels, count = ndimage.label(mask, structure=np.ones((3, 3), dtype=bool))
+        regions = np.zeros(count, dtype=REGION_DTYPE)
+        if count == 0:
+            return regions
+        # Unbuffered per-region reductions over the anomalous pixels (no sorting)
+        pixels = np.flatnonzero(labels)
+        region_of = labels.ravel()[pixels] - 1
+        values = deviation.ravel()[pixels]
+        rows, cols = np.divmod(pixels, mask.shape[1])
+
+        regions['pixel_count'] = np.bincount(region_of, minlength=count)
+        peak = np.full(count, -np.inf)
+        np.maximum.at(peak, region_of, values)
+        regions['peak_value'] = peak
+        # First pixel (raster order) reaching the region's peak
+        at_peak = values == peak[region_of]
+        peak_pixel = np.full(count, pixels[-1])
+        np.minimum.at(peak_pixel, region_of[at_peak], pixels[at_peak])
+        regions['peak_row'], regions['peak_col'] = np.divmod(peak_pixel, mask.shape[1])
+        for name, coord, reduce, start in (('row_min', rows, np.minimum, rows.max()),
+                                           ('row_max', rows, np.maximum, 0),
+                                           ('col_min', cols, np.minimum, cols.max()),
+                                           ('col_max', cols, np.maximum, 0)):
+            bound = np.full(count, start)
+            reduce.at(bound, region_of, coord)
+            regions[name] = bound
+        order = np.argsort(-regions['peak_value'], kind='stable')
+        return regions[order[:max_regions]]
+
+    def spectrogram(self, wavefront_source, window=256, hop=None, window_fn=np.hanning, block_rows=256,
+                    block_frames=64, workers=None, keep_map=True, accumulator=None):
+        """
+        Streaming short-time spectral analysis of each row (time runs along columns).
+        wavefront_source: 2-D array or np.memmap, a path to a .npy file (memory-mapped),
+        or an iterator of (rows, cols) row blocks. Data is read block_rows rows by
+        block_frames frames at a time, so the complex spectra are never held in full.
+        Pass an existing accumulator to keep averaging across several recordings.
+        Returns: SpectrogramAccumulator with time_frequency_map and average_spectrum.
+        """
+        hop = hop or window // 2
+        taper = np.asarray(window_fn(window)) if callable(window_fn) else np.asarray(window_fn)
+
+        if isinstance(wavefront_source, str):
+            wavefront_source = np.load(wavefront_source, mmap_mode='r')
+        if hasattr(wavefront_source, 'shape'):
+            source = wavefront_source
+            blocks = (source[start:start + block_rows] for start in range(0, source.shape[0], block_rows))
+        else:
+            blocks = iter(wavefront_source)
+
+        for block in blocks:
+            cols = block.shape[1]
+            n_frames = (cols - window) // hop + 1 if cols >= window else 0
+            onesided = not np.iscomplexobj(block)
+            if accumulator is None:
+                accumulator = SpectrogramAccumulator(n_frames, window, hop, self.sample_rate_thz,
+                                                     onesided=onesided, keep_map=keep_map)
+            for first in range(0, n_frames, block_frames):
+                last = min(first + block_frames, n_frames)
+                # Columns covering frames [first, last), read straight from the (mapped) source
+                segment = np.asarray(block[:, first * hop:(last - 1) * hop + window])
+                frames = np.lib.stride_tricks.sliding_window_view(segment, window, axis=1)[:, ::hop]
+                transform = rfft if onesided else fft
+                magnitudes = np.abs(transform(frames * taper, axis=-1, workers=workers))
+                accumulator.add(magnitudes, first)
+
+        return accumulator
@@ -2,38 +2,167 @@
 # Constructs and manages ultra-long exposure photon detection array
 # Author: Bryce Wooster
 
+import os
+import json
+import time
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Checkpoint file layout: JSON header padded to CHECKPOINT_HEADER_BYTES, then raw accumulator rows
+CHECKPOINT_HEADER_BYTES = 4096
+DEFAULT_CHECKPOINT_EVERY_S = 60.0
+SNAPSHOT_BAND_ROWS = 64
+
+def _on_sensor_hits(x, y, intensity, width, height):
+    """
+    Flat pixel indices and intensities of the events that land on the sensor.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    on_sensor = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+    pixels = y[on_sensor].astype(np.int64) * width + x[on_sensor].astype(np.int64)
+    return pixels, np.broadcast_to(intensity, on_sensor.shape)[on_sensor]
+
+def _add_events(target, x, y, intensity, width, height, chunk_size):
+    """
+    Add photon events into the flattened image `target` in place, chunk_size at a time.
+    Returns a mask of the snapshot row bands that received hits.
+    """
+    band_pixels = SNAPSHOT_BAND_ROWS * width
+    touched = np.zeros(-(-height // SNAPSHOT_BAND_ROWS), dtype=bool)
+    for i in range(0, len(x), chunk_size):
+        pixels, weights = _on_sensor_hits(x[i:i + chunk_size], y[i:i + chunk_size],
+                                          intensity[i:i + chunk_size], width, height)
+        # Unbuffered add: duplicate pixel hits sum correctly (unlike fancy-index +=)
+        np.add.at(target, pixels, weights.astype(target.dtype, copy=False))
+        touched |= np.bincount(pixels // band_pixels, minlength=len(touched)) > 0
+    return touched
+
+def _accumulate_shard(x, y, intensity, width, height, dtype, chunk_size):
+    """
+    Partial image (flattened, in dtype) of one worker's share of photon events,
+    plus the mask of row bands it touched.
+    """
+    partial = np.zeros(width * height, dtype=dtype)
+    return partial, _add_events(partial, x, y, intensity, width, height, chunk_size)
 
 class DeepFieldSensorArray:
     """
     Emulates a deep-field photon accumulation sensor matrix with noise reduction.
     Useful for collecting faint interstellar light over long exposures.
+
+    Photon events are accumulated in bulk: bounds masking and duplicate pixel hits
+    are handled in vectorized form per chunk, and large batches can be sharded
+    across a thread or process pool into one partial image per worker, summed at the end.
+    dtype selects the accumulator precision.
+
+    With storage_path set, the accumulator (and noise profile) live in memory-mapped
+    files, so exposures can exceed RAM. checkpoint() writes a consistent copy of the
+    accumulator plus its counters to <storage_path>.ckpt (temp file + atomic rename),
+    automatically every checkpoint_every_s seconds of accumulation (60 s by default).
+    A restarted array reopens the accumulator in place and resumes from the checkpoint;
+    resume=False, or a noise profile of another geometry, starts a fresh exposure.
+    snapshot() returns a cleaned image refreshed only in the row bands touched since
+    the previous snapshot.
     """
 
-    def __init__(self, width=128, height=128, integration_time_s=600.0):
+    def __init__(self, width=128, height=128, integration_time_s=600.0, dtype=np.float64,
+                 storage_path=None, checkpoint_every_s=DEFAULT_CHECKPOINT_EVERY_S, resume=True):
         self.width = width
         self.height = height
         self.integration_time_s = integration_time_s
-        self.signal_matrix = np.zeros((height, width), dtype=np.float64)
-        self.noise_profile = self._generate_noise_profile()
+        self.dtype = np.dtype(dtype)
+        self.storage_path = storage_path
+        self.checkpoint_every_s = checkpoint_every_s
+        self.events_integrated = 0
+        self.last_checkpoint = time.monotonic()
+        n_bands = -(-height // SNAPSHOT_BAND_ROWS)
+        self._dirty_bands = np.ones(n_bands, dtype=bool)
+        if storage_path is None:
+            self.signal_matrix = np.zeros((height, width), dtype=self.dtype)
+            self.noise_profile = self._generate_noise_profile()
+            self._snapshot = np.empty((height, width))
+            return
+
+        self.checkpoint_path = storage_path + '.ckpt'
+        noise_path = storage_path + '.noise.npy'
+        noise = np.load(noise_path, mmap_mode='r') if resume and os.path.exists(noise_path) else None
+        fresh = noise is None or noise.shape != (height, width) or noise.dtype != np.float64
+        if not fresh:
+            self.noise_profile = noise
+        else:
+            del noise
+            # A fresh noise profile starts a fresh exposure: drop the old checkpoint first,
+            # so a later resume cannot pair it with noise it was not taken against
+            if os.path.exists(self.checkpoint_path):
+                os.remove(self.checkpoint_path)
+            self.noise_profile = np.lib.format.open_memmap(noise_path, mode='w+', dtype=np.float64,
+                                                           shape=(height, width))
+            for lo in range(0, height, SNAPSHOT_BAND_ROWS):
+                hi = min(lo + SNAPSHOT_BAND_ROWS, height)
+                self.noise_profile[lo:hi] = self._generate_noise_profile(rows=hi - lo)
+            self.noise_profile.flush()
+        # Resuming keeps the accumulator file (r+); only a fresh exposure truncates it
+        accumulator_bytes = height * width * self.dtype.itemsize
+        keep = not fresh and os.path.exists(storage_path) and os.path.getsize(storage_path) == accumulator_bytes
+        self.signal_matrix = np.memmap(storage_path, dtype=self.dtype, mode='r+' if keep else 'w+',
+                                       shape=(height, width))
+        self._snapshot = np.memmap(storage_path + '.snapshot', dtype=np.float64, mode='w+', shape=(height, width))
+        if not fresh:
+            self.resume()
 
-    def _generate_noise_profile(self):
+    def _generate_noise_profile(self, rows=None):
         """
         Simulates thermal and sensor-line noise typical of long exposure
         imaging arrays (CCD or superconducting nanowire types).
         """
-        thermal_noise = np.random.normal(loc=0.0, scale=0.002, size=(self.height, self.width))
-        line_noise = np.random.normal(loc=0.0, scale=0.001, size=(self.height, 1))
+        rows = self.height if rows is None else rows
+        thermal_noise = np.random.normal(loc=0.0, scale=0.002, size=(rows, self.width))
+        line_noise = np.random.normal(loc=0.0, scale=0.001, size=(rows, 1))
         return thermal_noise + line_noise
 
     def accumulate_photons(self, photon_events):
         """
         Integrates incident photon events into the signal matrix, mimicking deep
         space long-term light collection from micro-mirror field convergence.
+        photon_events: iterable of (x, y, intensity) or an (n, 3) array
         """
-        for (x, y, intensity) in photon_events:
-            if 0 <= x < self.width and 0 <= y < self.height:
-                self.signal_matrix[y, x] += intensity
+        events = np.asarray(photon_events if isinstance(photon_events, np.ndarray) else list(photon_events))
+        if events.size == 0:
+            return
+        events = events.reshape(-1, 3)
+        self.accumulate_arrays(events[:, 0], events[:, 1], events[:, 2])
+
+    def accumulate_arrays(self, x, y, intensity, workers=1, executor='thread', chunk_size=1 << 22):
+        """
+        Bulk-integrate photon events given as x, y and intensity arrays (intensity may
+        be a scalar). Events are processed chunk_size at a time and added in place;
+        with workers > 1 the events are split into one contiguous share per worker of a
+        thread ('thread') or process ('process') pool, each folded into a single partial
+        image in the accumulator dtype, and the partials are reduced into the signal matrix.
+        """
+        x = np.asarray(x)
+        y = np.asarray(y)
+        intensity = np.broadcast_to(np.asarray(intensity), x.shape)
+        total = self.signal_matrix.reshape(-1)
+        workers = min(workers, os.cpu_count() or workers, -(-len(x) // chunk_size))
+        if workers <= 1:
+            self._dirty_bands |= _add_events(total, x, y, intensity, self.width, self.height, chunk_size)
+        else:
+            # One contiguous share of the events per worker, so at most `workers` partials exist
+            bounds = np.linspace(0, len(x), workers + 1).astype(np.int64)
+            shards = [(x[lo:hi], y[lo:hi], intensity[lo:hi], self.width, self.height, self.dtype, chunk_size)
+                      for lo, hi in zip(bounds[:-1], bounds[1:])]
+            pool_type = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+            with pool_type(max_workers=workers) as pool:
+                for partial, touched in pool.map(_accumulate_shard, *zip(*shards)):
+                    total += partial
+                    self._dirty_bands |= touched
+        self.events_integrated += len(x)
+
+        if (self.storage_path is not None and self.checkpoint_every_s is not None
+                and time.monotonic() - self.last_checkpoint >= self.checkpoint_every_s):
+            self.checkpoint()
 
     def finalize_image(self):
         """
@@ -42,10 +171,78 @@ class DeepFieldSensorArray:
         """
         cleaned_image = self.signal_matrix - self.noise_profile
         cleaned_image[cleaned_image < 0] = 0
-        return cleaned_image
+        return np.asarray(cleaned_image)
+
+    def snapshot(self):
+        """
+        Cleaned image of the exposure so far (as finalize_image), recomputed only in
+        row bands that received photons since the last snapshot. The returned buffer
+        is reused by the next call.
+        """
+        for band in np.flatnonzero(self._dirty_bands):
+            rows = slice(band * SNAPSHOT_BAND_ROWS, (band + 1) * SNAPSHOT_BAND_ROWS)
+            np.subtract(self.signal_matrix[rows], self.noise_profile[rows], out=self._snapshot[rows])
+            np.maximum(self._snapshot[rows], 0, out=self._snapshot[rows])
+        self._dirty_bands[:] = False
+        return self._snapshot
+
+    def checkpoint(self):
+        """
+        Persist the accumulator and counters to <storage_path>.ckpt. The file is
+        written beside the old one and atomically renamed over it, so a crash at any
+        point leaves the previous or the new checkpoint intact.
+        """
+        if self.storage_path is None:
+            raise RuntimeError("checkpoint() requires storage_path")
+        header = json.dumps({
+            'width': self.width,
+            'height': self.height,
+            'dtype': self.dtype.str,
+            'events_integrated': self.events_integrated,
+            'saved_utc': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        }).encode().ljust(CHECKPOINT_HEADER_BYTES)
+        temp_path = self.checkpoint_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(header)
+            for lo in range(0, self.height, SNAPSHOT_BAND_ROWS):
+                f.write(np.ascontiguousarray(self.signal_matrix[lo:lo + SNAPSHOT_BAND_ROWS]).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.checkpoint_path)
+        self.signal_matrix.flush()
+        self.last_checkpoint = time.monotonic()
+
+    def resume(self):
+        """
+        Restore the accumulator and counters from the last checkpoint, if any.
+        Returns True when an exposure was resumed.
+        """
+        if not os.path.exists(self.checkpoint_path):
+            return False
+        with open(self.checkpoint_path, 'rb') as f:
+            meta = json.loads(f.read(CHECKPOINT_HEADER_BYTES).rstrip())
+        if (meta['width'], meta['height'], meta['dtype']) != (self.width, self.height, self.dtype.str):
+            raise ValueError(f"Checkpoint {self.checkpoint_path} does not match this sensor geometry/dtype")
+        saved = np.memmap(self.checkpoint_path, dtype=self.dtype, mode='r', offset=CHECKPOINT_HEADER_BYTES,
+                          shape=(self.height, self.width))
+        for lo in range(0, self.height, SNAPSHOT_BAND_ROWS):
+            self.signal_matrix[lo:lo + SNAPSHOT_BAND_ROWS] = saved[lo:lo + SNAPSHOT_BAND_ROWS]
+        del saved
+        self.signal_matrix.flush()
+        self.events_integrated = meta['events_integrated']
+        self._dirty_bands[:] = True
+        self.last_checkpoint = time.monotonic()
+        return True
 
     def reset(self):
         """
         Clears the signal matrix for a fresh observation window.
+        The accumulator is zeroed in place and any checkpoint of the old exposure is dropped.
         """
-        self.signal_matrix = np.zeros((self.height, self.width), dtype=np.float64)
+        self.signal_matrix[...] = 0
+        self.events_integrated = 0
+        self._dirty_bands[:] = True
+        if self.storage_path is not None:
+            self.signal_matrix.flush()
+            if os.path.exists(self.checkpoint_path):
+                os.remove(self.checkpoint_path)
@@ -9,15 +9,11 @@ and routes real-time signal data into FFT and volumetric waveform analyzers.
 """
 
 import time
+import threading
 import numpy as np
-import spidev
-import RPi.GPIO as GPIO
 from datetime import datetime
 from scipy.fftpack import fft
-import board
-import busio
-import adafruit_tca9548a  # For I2C multiplexer control
-import serial
+from hardware_backend import get_backend  # Real SPI/GPIO or simulated (IX_BEAVIS_BACKEND=sim)
 
 # --- SENSOR CONFIGURATION ---
 PHOTODIODE_CHANNELS = [0, 1, 2]  # Quantum dot detectors (UV, Visible, IR)
@@ -27,17 +23,30 @@ ADC_VREF = 3.3  # V
 # --- MICROMIRROR GPIO CONFIG (DLP-style control) ---
 MIRROR_ENABLE_PINS = [17, 27, 22]  # GPIO for mirror field locking triggers
 MIRROR_PWM_PINS = [18, 23, 24]     # PWM pin control for phase tilting
+MIRROR_PWM_BASE_FREQ = 500         # Hz, axis i runs at base + i * step (slightly varied per axis)
+MIRROR_PWM_FREQ_STEP = 100         # Hz
+MIRROR_LATCH_TIME = 0.05           # s, PWM drive time for the mirrors to latch a tilt phase
+
+# --- BURST ACQUISITION TIMING ---
+SPIN_THRESHOLD = 0.0005  # s, busy-wait the final stretch before a deadline instead of sleeping
+
+# --- CONTINUOUS CAPTURE CONFIG ---
+CONTINUOUS_MODE = False   # Run the live ring-buffer monitor instead of a one-shot capture
+RING_SECONDS = 60.0       # Seconds of history held by the acquisition ring buffer
+WINDOW_SECONDS = 2.0      # Analysis window length handed to live consumers
+HOP_SECONDS = 0.5         # Spacing between successive (overlapping) analysis windows
+
+# --- HARDWARE BACKEND ---
+backend = get_backend()
 
 # --- SPI ADC CONFIG (MCP3208 or similar) ---
-spi = spidev.SpiDev()
-spi.open(0, 0)
-spi.max_speed_hz = 1000000
+spi = backend.open_spi(0, 0, max_speed_hz=1000000, role="adc")
 
 # --- I2C SETUP FOR MULTIPLEXING SENSORS ---
-i2c = busio.I2C(board.SCL, board.SDA)
-tca = adafruit_tca9548a.TCA9548A(i2c)
+i2c, tca = backend.open_i2c_mux()
 
 # --- INIT GPIO ---
+GPIO = backend.gpio()
 GPIO.setmode(GPIO.BCM)
 for pin in MIRROR_ENABLE_PINS + MIRROR_PWM_PINS:
     GPIO.setup(pin, GPIO.OUT)
@@ -50,15 +59,111 @@ def read_adc(channel):
     voltage = (result / 4096.0) * ADC_VREF
     return voltage
 
+def build_burst_command(channels):
+    """Build one SPI transaction that converts every channel back-to-back"""
+    tx = []
+    for ch in channels:
+        tx += [0b11 << 6 | (ch & 0x07) << 3, 0x0, 0x0]
+    return tx
+
+def read_adc_burst(tx, out):
+    """Run a prebuilt burst transaction and write channel voltages into `out`"""
+    adc = np.asarray(spi.xfer2(list(tx)), dtype=np.uint16).reshape(-1, 3)
+    result = ((adc[:, 1] & 0x0F) << 8) | adc[:, 2]
+    np.multiply(result, ADC_VREF / 4096.0, out=out)
+    return out
+
+class MirrorSyncManager:
+    """
+    Keeps one persistent PWM handle per micromirror axis and drives all
+    MIRROR_PWM_PINS together. sync_async() returns immediately with an Event that is
+    set once the mirrors have latched, so capture can start without waiting a full
+    blocking sequence; the duration of every sync is recorded for lead-time tuning.
+    """
+
+    def __init__(self, enable_pins=MIRROR_ENABLE_PINS, pwm_pins=MIRROR_PWM_PINS):
+        self.enable_pins = list(enable_pins)
+        self.frequencies = [MIRROR_PWM_BASE_FREQ + i * MIRROR_PWM_FREQ_STEP for i in range(len(pwm_pins))]
+        self.pwms = [GPIO.PWM(pin, freq) for pin, freq in zip(pwm_pins, self.frequencies)]
+        for pwm in self.pwms:
+            pwm.start(0)
+        self.latched = threading.Event()
+        self.last_sync_duration = None
+        self._release_timer = None
+        self._sync_id = 0  # Bumped per sync; releases from older syncs are ignored
+        self._lock = threading.Lock()
+
+    def set_frequencies(self, frequencies):
+        """Retune the axis PWM frequencies in place"""
+        for pwm, freq in zip(self.pwms, frequencies):
+            pwm.ChangeFrequency(freq)
+        self.frequencies = list(frequencies)
+
+    def _set_duty(self, duty):
+        for pwm in self.pwms:
+            pwm.ChangeDutyCycle(duty)
+
+    def _release(self, started, sync_id):
+        with self._lock:
+            if sync_id != self._sync_id:
+                return  # Superseded: the timer fired while a newer sync held the lock
+            self._release_timer = None
+            self._set_duty(0)
+            self.last_sync_duration = time.monotonic() - started
+            self.latched.set()
+
+    def sync_async(self, enable=True, pwm_duty=50, hold=MIRROR_LATCH_TIME):
+        """
+        Start a sync on all axes at once and return the latch Event without blocking.
+        After `hold` seconds the PWM duty drops to 0 (handles stay alive); hold=None
+        keeps the axes driven until the next sync.
+        """
+        started = time.monotonic()
+        with self._lock:
+            if self._release_timer is not None:
+                self._release_timer.cancel()
+                self._release_timer = None
+            self._sync_id += 1
+            self.latched.clear()
+            level = GPIO.HIGH if enable else GPIO.LOW
+            for enable_pin in self.enable_pins:
+                GPIO.output(enable_pin, level)
+            if not enable or hold is None:
+                self._set_duty(pwm_duty if enable else 0)
+                self.last_sync_duration = time.monotonic() - started
+                self.latched.set()
+                return self.latched
+            self._set_duty(pwm_duty)
+            self._release_timer = threading.Timer(hold, self._release, args=(started, self._sync_id))
+            self._release_timer.daemon = True
+            self._release_timer.start()
+        return self.latched
+
+    def sync(self, enable=True, pwm_duty=50, hold=MIRROR_LATCH_TIME):
+        """Blocking variant of sync_async(); returns the sync duration in seconds"""
+        self.sync_async(enable, pwm_duty, hold).wait()
+        return self.last_sync_duration
+
+    def close(self):
+        with self._lock:
+            self._sync_id += 1
+            if self._release_timer is not None:
+                self._release_timer.cancel()
+        for pwm in self.pwms:
+            pwm.stop()
+
+mirror_manager = None
+
+def get_mirror_manager():
+    """Lazily create the shared mirror manager (PWM handles are opened once)"""
+    global mirror_manager
+    if mirror_manager is None:
+        mirror_manager = MirrorSyncManager()
+    return mirror_manager
+
 def sync_mirror_array(enable=True, pwm_duty=50):
     """Set micromirror tilt phase and sync cycle state"""
-    for enable_pin in MIRROR_ENABLE_PINS:
-        GPIO.output(enable_pin, GPIO.HIGH if enable else GPIO.LOW)
-    for i, pwm_pin in enumerate(MIRROR_PWM_PINS):
-        pwm = GPIO.PWM(pwm_pin, 500 + (i * 100))  # Slightly varied frequency per axis
-        pwm.start(pwm_duty)
-        time.sleep(0.05)
-        pwm.stop()
+    return get_mirror_manager().sync(enable, pwm_duty)
 
 def capture_photon_trace(duration=5.0, interval=0.01):
     """Capture multi-spectral photon sample set"""
@@ -77,22 +182,201 @@ def capture_photon_trace(duration=5.0, interval=0.01):
 
     return timestamps, data
 
+def wait_until(deadline):
+    """Sleep, then spin, until the monotonic clock reaches `deadline`; returns the wake time"""
+    remaining = deadline - time.monotonic()
+    if remaining > SPIN_THRESHOLD:
+        time.sleep(remaining - SPIN_THRESHOLD)
+    now = time.monotonic()
+    while now < deadline:
+        now = time.monotonic()
+    return now
+
+def capture_photon_burst(duration=5.0, interval=0.01):
+    """
+    Drift-free multi-spectral capture: one SPI burst converts all channels per sample,
+    samples are scheduled against absolute monotonic deadlines and written into
+    preallocated arrays. Returns (timestamps, data, stats) where timestamps are
+    time.monotonic() seconds and stats reports the achieved rate, jitter and misses.
+    """
+    if interval <= 0:
+        raise ValueError("interval must be positive")
+    n_samples = int(round(duration / interval))
+    samples = np.empty((len(PHOTODIODE_CHANNELS), n_samples))
+    timestamps = np.empty(n_samples)
+    tx = build_burst_command(PHOTODIODE_CHANNELS)
+    column = np.empty(len(PHOTODIODE_CHANNELS))
+    print("[*] Capturing photon trace (burst mode)...")
+
+    start_utc = datetime.utcnow().timestamp()
+    start_time = time.monotonic() + interval
+    for i in range(n_samples):
+        timestamps[i] = wait_until(start_time + i * interval)
+        samples[:, i] = read_adc_burst(tx, column)
+
+    deadlines = start_time + np.arange(n_samples) * interval
+    lateness = timestamps - deadlines
+    elapsed = timestamps[-1] - timestamps[0] if n_samples > 1 else 0.0
+    stats = {
+        "start_utc": start_utc,
+        "nominal_rate": 1.0 / interval,
+        "achieved_rate": float((n_samples - 1) / elapsed) if elapsed > 0 else 0.0,
+        "jitter_rms": float(np.std(lateness)) if n_samples else 0.0,
+        "jitter_max": float(np.max(lateness)) if n_samples else 0.0,
+        "missed_deadlines": int(np.count_nonzero(lateness >= interval)),
+    }
+    data = {ch: samples[k] for k, ch in enumerate(PHOTODIODE_CHANNELS)}
+    return timestamps, data, stats
+
+class PhotonRingBuffer:
+    """
+    Fixed-size multi-channel ring buffer written by a single acquisition thread.
+    Every sample is stored twice (at i and i + capacity), so any window up to
+    `capacity` samples long is one contiguous NumPy view — consumers never copy.
+    """
+
+    def __init__(self, capacity, channels=PHOTODIODE_CHANNELS):
+        self.capacity = int(capacity)
+        self.channels = list(channels)
+        self.timestamps = np.zeros(2 * self.capacity)
+        self.samples = np.zeros((len(self.channels), 2 * self.capacity))
+        self.count = 0  # Total samples ever written; published after each write
+
+    def append(self, timestamp, column):
+        i = self.count % self.capacity
+        self.timestamps[i] = self.timestamps[i + self.capacity] = timestamp
+        self.samples[:, i] = column
+        self.samples[:, i + self.capacity] = column
+        self.count += 1
+
+    def oldest(self):
+        """Absolute index of the oldest sample still held in the buffer"""
+        return max(0, self.count - self.capacity)
+
+    def window(self, length, end=None):
+        """
+        Return (timestamps, data) views of `length` samples ending at absolute index `end`
+        (default: newest). data maps channel -> 1-D view. Views stay valid until the
+        sampler has written another `capacity - length` samples.
+        """
+        end = self.count if end is None else end
+        if length > self.capacity or end > self.count or end - length < self.oldest():
+            raise ValueError("Requested window is not held in the ring buffer.")
+        start = (end - length) % self.capacity
+        block = self.samples[:, start:start + length]
+        return self.timestamps[start:start + length], dict(zip(self.channels, block))
+
+
+class ContinuousCapture(threading.Thread):
+    """
+    Background acquisition thread: samples all photodiode channels on absolute
+    deadlines into a PhotonRingBuffer until stop() is called. Consumers pull
+    overlapping windows with windows() while the sampler keeps running.
+    """
+
+    def __init__(self, interval=0.01, ring_seconds=RING_SECONDS):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.ring = PhotonRingBuffer(int(round(ring_seconds / interval)))
+        self.missed_deadlines = 0
+        self.dropped_windows = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        tx = build_burst_command(self.ring.channels)
+        column = np.empty(len(self.ring.channels))
+        start_time = time.monotonic() + self.interval
+        i = 0
+        while not self._stop_event.is_set():
+            deadline = start_time + i * self.interval
+            t_now = wait_until(deadline)
+            if t_now - deadline >= self.interval:
+                self.missed_deadlines += 1
+            self.ring.append(t_now, read_adc_burst(tx, column))
+            i += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def achieved_rate(self):
+        """Sample rate measured over the newest half of the ring (safe while sampling)"""
+        ring = self.ring
+        while True:
+            end = ring.count  # Single snapshot; the sampler keeps appending
+            # Measure over half the ring so the sampler has headroom while we read
+            held = min(end, ring.capacity // 2)
+            if held < 2:
+                return 0.0
+            t_first = float(ring.timestamps[(end - held) % ring.capacity])
+            t_last = float(ring.timestamps[(end - 1) % ring.capacity])
+            if ring.count - end <= ring.capacity - held:
+                break  # Neither sample was overwritten during the read
+        elapsed = t_last - t_first
+        return (held - 1) / elapsed if elapsed > 0 else 0.0
+
+    def windows(self, window_seconds=WINDOW_SECONDS, hop_seconds=HOP_SECONDS):
+        """
+        Yield (timestamps, data) views of overlapping windows as soon as each is complete.
+        A consumer that falls more than a ring's worth behind skips ahead to the newest
+        complete window and the skipped windows are counted in dropped_windows.
+        """
+        length = int(round(window_seconds / self.interval))
+        hop = max(1, int(round(hop_seconds / self.interval)))
+        end = length
+        while not self._stop_event.is_set() or self.ring.count >= end:
+            if self.ring.count < end:
+                time.sleep(self.interval)
+                continue
+            # Keep a hop of headroom so the sampler can't overwrite the view mid-use
+            if end - length < self.ring.count - self.ring.capacity + hop:
+                newest = self.ring.count - (self.ring.count - length) % hop
+                self.dropped_windows += (newest - end) // hop
+                end = newest
+            yield self.ring.window(length, end)
+            end += hop
+
 def compute_fft(channel_data, sample_rate):
     """Compute FFT for a given photon signal"""
-    data = np.array(channel_data)
+    data = np.asarray(channel_data)
     n = len(data)
     freq = np.fft.fftfreq(n, d=1/sample_rate)
     amp = np.abs(fft(data)) / n
     return freq[:n // 2], amp[:n // 2]
 
+def run_continuous(duration=10.0, interval=0.01):
+    """Live monitor: report per-window peak frequencies while the sampler keeps running"""
+    capture = ContinuousCapture(interval=interval)
+    capture.start()
+    print("[*] Continuous capture running...")
+    t_stop = time.monotonic() + duration
+    for timestamps, window in capture.windows():
+        rate = capture.achieved_rate()
+        for ch in PHOTODIODE_CHANNELS:
+            freq, amp = compute_fft(window[ch], sample_rate=rate)
+            print(f"[CH{ch} @ {timestamps[-1]:.2f}] Peak freq: {freq[np.argmax(amp)]:.2f} Hz | "
+                  f"Amplitude: {np.max(amp):.4f} V")
+        if time.monotonic() >= t_stop:
+            break
+    capture.stop()
+    print(f"[*] Missed deadlines: {capture.missed_deadlines} | dropped windows: {capture.dropped_windows}")
+
 def main():
     print("[*] Initializing IX-Beavis Capture Interface (GOD MODE)")
     sync_mirror_array(enable=True, pwm_duty=60)
+    print(f"[*] Mirror field latched in {get_mirror_manager().last_sync_duration * 1e3:.1f} ms")
+
+    if CONTINUOUS_MODE:
+        run_continuous(duration=10.0, interval=0.01)
+        sync_mirror_array(enable=False)
+        return
+
+    timestamps, signal_data, stats = capture_photon_burst(duration=10.0, interval=0.01)
+    print(f"[*] Achieved {stats['achieved_rate']:.2f} Hz (nominal {stats['nominal_rate']:.2f} Hz) | "
+          f"jitter {stats['jitter_rms'] * 1e6:.1f} us RMS | missed deadlines: {stats['missed_deadlines']}")
 
-    timestamps, signal_data = capture_photon_trace(duration=10.0, interval=0.01)
-    
     for ch in PHOTODIODE_CHANNELS:
-        freq, amp = compute_fft(signal_data[ch], sample_rate=1/0.01)
+        freq, amp = compute_fft(signal_data[ch], sample_rate=stats['achieved_rate'])
         print(f"[CH{ch}] Peak freq: {freq[np.argmax(amp)]:.2f} Hz | Amplitude: {np.max(amp):.4f} V")
 
     sync_mirror_array(enable=False)
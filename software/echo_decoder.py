@@ -9,10 +9,14 @@ and temporal envelope anomalies. Designed for cosmic signal memory deconstructio
 multi-frame spectral-field correlation.
 """
 
+import os
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from scipy.signal import find_peaks, hilbert, correlate
 from scipy.fftpack import fft, ifft
+from scipy.fft import next_fast_len
 from datetime import datetime
 
 # --- CONFIGURABLE PARAMETERS ---
@@ -20,11 +24,12 @@ SAMPLE_RATE = 100.0      # Hz (default from capture_interface)
 ECHO_THRESHOLD = 0.15     # Minimum amplitude threshold (V) for echo recognition
 LAG_WINDOW = 0.3          # Seconds, echo scan limit
 VOLATILITY_TOL = 0.05     # % variation from baseline to consider "resonance memory shift"
+STREAM_OVERLAP = 256      # Samples of context kept either side of each streamed envelope block
 
 def load_trace(timestamps, data_dict):
     """Restructure time/data arrays from capture interface"""
-    t = np.array(timestamps)
-    traces = {k: np.array(v) for k, v in data_dict.items()}
+    t = np.asarray(timestamps)
+    traces = {k: np.asarray(v) for k, v in data_dict.items()}
     return t, traces
 
 def detect_echo_peaks(trace, rate=SAMPLE_RATE):
@@ -40,6 +45,99 @@ def extract_resonance_pattern(trace):
     fft_amp = np.abs(fft(trace))[:len(freqs)]
     return freqs, fft_amp
 
+def stack_traces(traces):
+    """Stack a {channel: trace} map into one (channels, samples) array"""
+    channels = list(traces.keys())
+    return channels, np.vstack([traces[ch] for ch in channels])
+
+def detect_echo_peaks_batch(stack, rate=SAMPLE_RATE):
+    """Envelope every row of a trace stack in one pass, then locate echo peaks per row"""
+    envelopes = np.abs(hilbert(stack, axis=-1))
+    echo_times = [find_peaks(env, height=ECHO_THRESHOLD)[0] / rate for env in envelopes]
+    return echo_times, envelopes
+
+def extract_resonance_batch(stack):
+    """Real-input spectra of every row of a trace stack"""
+    freqs = np.fft.rfftfreq(stack.shape[-1], d=1.0/SAMPLE_RATE)
+    fft_amp = np.abs(np.fft.rfft(stack, axis=-1))
+    return freqs, fft_amp
+
+class StreamingEchoDetector:
+    """
+    Chunked echo detector for unbounded traces. Each block is enveloped together with
+    `overlap` samples of context on both sides (overlap-save), so the streamed envelope
+    tracks a global Hilbert transform (error shrinks as overlap grows). Envelope samples
+    are emitted `overlap` samples behind the newest input; peaks that sit on a block
+    boundary are carried into the next block. A trailing plateau is carried as its
+    value plus its length, so memory stays bounded by chunk + 2 * overlap even on a
+    flat (dark or disconnected) channel.
+    """
+
+    def __init__(self, rate=SAMPLE_RATE, threshold=ECHO_THRESHOLD, overlap=STREAM_OVERLAP, start_time=0.0):
+        self.rate = rate
+        self.threshold = threshold
+        self.overlap = overlap
+        self.start_time = start_time
+        self.emitted = 0                 # Absolute index of the next envelope sample to emit
+        self._raw = np.empty(0)          # Left context + samples not yet enveloped
+        self._left = 0                   # Left-context samples at the head of _raw
+        self._carry = np.empty(0)        # [left neighbour,] trailing plateau value
+        self._carry_start = 0            # Absolute index of _carry[0]
+        self._plateau = 1                # Samples collapsed into _carry[-1]
+
+    def _find_events(self, envelope):
+        """Locate peaks in carry + new envelope; keep the unresolved tail as the new carry"""
+        joined = np.concatenate([self._carry, envelope])
+        collapsed = len(self._carry) - 1       # Index of the collapsed plateau sample (-1: none)
+        extra = self._plateau - 1              # Samples hidden by the collapse
+
+        def absolute(i, right=False):
+            """Absolute sample index of joined[i]; right=True maps the plateau to its last sample"""
+            i = np.asarray(i)
+            hidden = np.where(i > collapsed, extra, np.where((i == collapsed) & right, extra, 0))
+            return self._carry_start + i + hidden
+
+        peaks, props = find_peaks(joined, height=self.threshold, plateau_size=1)
+        # Plateau peaks sit in the middle of their full (uncollapsed) extent
+        peaks = (absolute(props["left_edges"]) + absolute(props["right_edges"], right=True)) // 2
+
+        # A trailing plateau (or last sample) could still become a peak: carry it with one left neighbour
+        last = len(joined) - 1
+        tail = last
+        while tail > 0 and joined[tail - 1] == joined[tail]:
+            tail -= 1
+        neighbour = max(0, tail - 1)
+        plateau_start = int(absolute(tail))
+        self._plateau = int(absolute(last, right=True)) - plateau_start + 1
+        self._carry = joined[[neighbour, tail]] if neighbour < tail else joined[[tail]]
+        self._carry_start = plateau_start - (tail - neighbour)
+        echo_times = self.start_time + peaks / self.rate
+        return echo_times, props["peak_heights"]
+
+    def feed(self, chunk):
+        """Consume a chunk of samples; returns (echo_times, amplitudes) of newly resolved echoes"""
+        buf = np.concatenate([self._raw, np.asarray(chunk, dtype=np.float64)])
+        n_valid = len(buf) - self._left - self.overlap
+        if n_valid <= 0:
+            self._raw = buf
+            return np.empty(0), np.empty(0)
+        envelope = np.abs(hilbert(buf))[self._left:self._left + n_valid]
+        self.emitted += n_valid
+        keep_from = max(0, self._left + n_valid - self.overlap)
+        self._raw = buf[keep_from:]
+        self._left = self._left + n_valid - keep_from
+        return self._find_events(envelope)
+
+    def flush(self):
+        """Envelope the remaining samples without right context at the end of a capture"""
+        envelope = np.abs(hilbert(self._raw))[self._left:] if len(self._raw) else np.empty(0)
+        self.emitted += len(envelope)
+        self._raw, self._left = np.empty(0), 0
+        # Append a trailing zero so a final rising edge is not reported as a peak
+        echo_times, amplitudes = self._find_events(np.append(envelope, -np.inf))
+        self._carry, self._carry_start, self._plateau = np.empty(0), self.emitted, 1
+        return echo_times, amplitudes
+
 def cross_echo_correlation(tr1, tr2):
     """Compute correlation between two traces to find time displacement echo match"""
     correlation = correlate(tr1, tr2, mode='full')
@@ -48,6 +146,36 @@ def cross_echo_correlation(tr1, tr2):
     strength = np.max(correlation)
     return lag_time, strength
 
+def cross_correlation_matrix(stack, rate=SAMPLE_RATE, lag_window=LAG_WINDOW, normalize=True):
+    """
+    All-pairs lag/strength matrices for a (channels, samples) stack. Each channel is
+    transformed once; every unordered pair is correlated from the shared spectra and
+    only lags within +/- lag_window seconds are searched. lags[i, j] is the displacement
+    (s) of channel i relative to channel j, so lags[j, i] == -lags[i, j]. With
+    normalize=True strengths are correlation coefficients in [-1, 1].
+    """
+    n_ch, n = stack.shape
+    max_lag = min(int(lag_window * rate), n - 1)
+    nfft = next_fast_len(2 * n - 1, real=True)
+    centered = stack - stack.mean(axis=-1, keepdims=True) if normalize else stack
+    spectra = np.fft.rfft(centered, n=nfft, axis=-1)
+
+    iu, ju = np.triu_indices(n_ch, k=1)
+    corr = np.fft.irfft(spectra[iu] * np.conj(spectra[ju]), n=nfft, axis=-1)
+    lag_index = np.r_[nfft - max_lag:nfft, 0:max_lag + 1]   # lags -max_lag .. +max_lag
+    corr = corr[:, lag_index]
+    if normalize:
+        energy = np.sum(centered ** 2, axis=-1)
+        corr /= np.sqrt(energy[iu] * energy[ju])[:, None] + 1e-12
+
+    best = np.argmax(corr, axis=-1)
+    lags = np.zeros((n_ch, n_ch))
+    strengths = np.ones((n_ch, n_ch)) if normalize else np.diag(np.sum(stack ** 2, axis=-1))
+    lags[iu, ju] = (best - max_lag) / rate
+    lags[ju, iu] = -lags[iu, ju]
+    strengths[iu, ju] = strengths[ju, iu] = corr[np.arange(len(best)), best]
+    return lags, strengths
+
 def plot_echo_output(t, envelope, echo_times, title="Echo Envelope"):
     """Visualize detected echo memory over time"""
     plt.figure(figsize=(10, 4))
@@ -62,34 +190,66 @@ def plot_echo_output(t, envelope, echo_times, title="Echo Envelope"):
     plt.tight_layout()
     plt.show()
 
-def analyze_echo(timestamps, signal_data):
-    """Master function: runs full echo and memory analysis on signal set"""
+def save_echo_plot(path, t, envelope, echo_times, title="Echo Envelope"):
+    """Render the echo envelope offscreen (Agg) straight to an image file"""
+    fig = Figure(figsize=(10, 4))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    ax.plot(t, envelope, label="Envelope")
+    for et in echo_times:
+        ax.axvline(et, color='red', linestyle='--', label=f"Echo @ {et:.2f}s")
+    ax.set_title(title)
+    ax.set_xlabel("Time (s)")
+    ax.set_ylabel("Amplitude (V)")
+    ax.grid(True)
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(path)
+
+def analyze_echo(timestamps, signal_data, headless=False, plot_dir=None):
+    """
+    Master function: runs full echo and memory analysis on signal set.
+    All channels are stacked and enveloped/transformed in a single pass. With
+    headless=True nothing is shown on screen; plots are only rendered offscreen
+    into plot_dir (if given) after the analysis.
+    """
     t, traces = load_trace(timestamps, signal_data)
+    channels, stack = stack_traces(traces)
+    all_echo_times, envelopes = detect_echo_peaks_batch(stack)
+    freqs, fft_amp = extract_resonance_batch(stack)
+    peak_bins = np.argmax(fft_amp, axis=-1)
+    peak_amps = np.max(fft_amp, axis=-1)
+    lags, strengths = cross_correlation_matrix(stack)
     results = {}
 
-    for ch, trace in traces.items():
-        echo_times, envelope = detect_echo_peaks(trace)
-        freqs, fft_amp = extract_resonance_pattern(trace)
+    for k, ch in enumerate(channels):
+        echo_times = all_echo_times[k]
 
         result = {
             "echo_count": len(echo_times),
             "echo_times": echo_times.tolist(),
-            "peak_frequency": freqs[np.argmax(fft_amp)],
-            "fft_amplitude": float(np.max(fft_amp)),
+            "peak_frequency": freqs[peak_bins[k]],
+            "fft_amplitude": float(peak_amps[k]),
         }
 
         # Check for multi-trace correlation
-        for other_ch, other_trace in traces.items():
+        for m, other_ch in enumerate(channels):
             if other_ch == ch:
                 continue
-            lag, strength = cross_echo_correlation(trace, other_trace)
             result[f"correlation_with_ch{other_ch}"] = {
-                "lag_seconds": lag,
-                "strength": float(strength)
+                "lag_seconds": float(lags[k, m]),
+                "strength": float(strengths[k, m])
             }
 
         results[f"channel_{ch}"] = result
-        plot_echo_output(t, np.abs(hilbert(trace)), echo_times, title=f"Channel {ch} Echo Trace")
+
+    for k, ch in enumerate(channels):
+        title = f"Channel {ch} Echo Trace"
+        if not headless:
+            plot_echo_output(t, envelopes[k], all_echo_times[k], title=title)
+        elif plot_dir is not None:
+            save_echo_plot(os.path.join(plot_dir, f"echo_channel_{ch}.png"),
+                           t, envelopes[k], all_echo_times[k], title=title)
 
     return results
 
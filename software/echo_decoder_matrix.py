@@ -2,19 +2,61 @@
 # Converts harmonic field data into visual and exportable profiles
 # Author: Bryce Wooster
 
-import csv
+import os
+import time
 import numpy as np
 import matplotlib.pyplot as plt
 
+HARMONICS = (3, 6, 9)
+FIELDS = tuple(f"harmonic_{h}_{part}" for h in HARMONICS for part in ("amp", "phase"))
+COLUMNS = ("timestamp",) + FIELDS
+RECORD_DTYPE = np.dtype([(name, np.float64) for name in COLUMNS])
+
 class EchoDecoderMatrix:
     """
     Decodes 3-6-9 harmonic field data into usable waveform outputs,
     enabling real-time visualization and export for physical diagnostics.
+
+    Readings are kept in a columnar store: one float64 row per column
+    (timestamp + amplitude/phase of each harmonic) inside fixed-size chunks.
+    With max_entries set, the oldest chunks are released so only the most
+    recent max_entries readings are retained.
     """
 
-    def __init__(self, enable_plot=True):
-        self.harmonic_log = []
+    def __init__(self, enable_plot=True, chunk_size=4096, max_entries=None):
         self.enable_plot = enable_plot
+        self.chunk_size = chunk_size
+        self.max_entries = max_entries
+        self._chunks = []
+        self._fill = chunk_size      # Rows used in the newest chunk (full => allocate next)
+        self._dropped = 0            # Readings released from the front of the store
+        self.total_ingested = 0
+        self._exported = {}          # filepath -> absolute index of the next row to append
+
+    def __len__(self):
+        return min(self.total_ingested - self._dropped, self.max_entries or self.total_ingested)
+
+    def _oldest_index(self):
+        """Absolute index of the oldest reading still available"""
+        return self.total_ingested - len(self)
+
+    def _append_block(self, block):
+        """Copy a (len(COLUMNS), n) block into the chunk store"""
+        n = block.shape[1]
+        written = 0
+        while written < n:
+            if self._fill == self.chunk_size:
+                self._chunks.append(np.empty((len(COLUMNS), self.chunk_size)))
+                self._fill = 0
+            take = min(n - written, self.chunk_size - self._fill)
+            self._chunks[-1][:, self._fill:self._fill + take] = block[:, written:written + take]
+            self._fill += take
+            written += take
+        self.total_ingested += n
+        if self.max_entries is not None:
+            while self.total_ingested - self._dropped - self.chunk_size >= self.max_entries:
+                self._chunks.pop(0)
+                self._dropped += self.chunk_size
 
     def ingest(self, harmonic_payload: dict):
         """
@@ -22,29 +64,76 @@ class EchoDecoderMatrix:
         Stores harmonic amplitude + phase values into log.
         """
         if harmonic_payload:
-            entry = {
-                "harmonic_3_amp": harmonic_payload["harmonic_3"]["amplitude"],
-                "harmonic_3_phase": harmonic_payload["harmonic_3"]["phase"],
-                "harmonic_6_amp": harmonic_payload["harmonic_6"]["amplitude"],
-                "harmonic_6_phase": harmonic_payload["harmonic_6"]["phase"],
-                "harmonic_9_amp": harmonic_payload["harmonic_9"]["amplitude"],
-                "harmonic_9_phase": harmonic_payload["harmonic_9"]["phase"]
-            }
-            self.harmonic_log.append(entry)
+            self.ingest_batch([harmonic_payload])
+
+    def ingest_batch(self, payloads, timestamps=None):
+        """
+        Ingest many readings in one call. Accepts a list of HarmonicReaderCoil payloads,
+        or a single payload whose amplitude/phase entries are arrays (batched feeds).
+        """
+        if isinstance(payloads, dict):
+            block = np.vstack([
+                np.atleast_1d(np.asarray(payloads[f"harmonic_{h}"][part], dtype=np.float64))
+                for h in HARMONICS for part in ("amplitude", "phase")
+            ])
+        else:
+            payloads = [p for p in payloads if p]
+            if not payloads:
+                return
+            block = np.array([
+                [p[f"harmonic_{h}"][part] for h in HARMONICS for part in ("amplitude", "phase")]
+                for p in payloads
+            ], dtype=np.float64).T
+        n = block.shape[1]
+        if timestamps is None:
+            timestamps = np.full(n, time.time())
+        self._append_block(np.vstack([np.broadcast_to(timestamps, (n,)), block]))
+
+    def columns(self, start=None):
+        """
+        Return {column: array} of retained readings in chronological order, optionally
+        starting at absolute reading index `start`. Single-chunk ranges are views.
+        """
+        first = self._oldest_index() if start is None else max(start, self._oldest_index())
+        offset = first - self._dropped
+        parts = []
+        for k, chunk in enumerate(self._chunks):
+            used = self._fill if k == len(self._chunks) - 1 else self.chunk_size
+            lo, hi = k * self.chunk_size, k * self.chunk_size + used
+            if hi <= offset:
+                continue
+            parts.append(chunk[:, max(0, offset - lo):used])
+        if not parts:
+            data = np.empty((len(COLUMNS), 0))
+        else:
+            data = parts[0] if len(parts) == 1 else np.hstack(parts)
+        return dict(zip(COLUMNS, data))
+
+    def latest(self):
+        """Most recent reading as a {field: value} dict, or None"""
+        if not len(self):
+            return None
+        return {name: float(self._chunks[-1][i, self._fill - 1]) for i, name in enumerate(COLUMNS)}
+
+    @property
+    def harmonic_log(self):
+        """Retained readings as a list of dicts (compatibility view; builds Python objects)"""
+        cols = self.columns()
+        return [dict(zip(FIELDS, row)) for row in zip(*(cols[f].tolist() for f in FIELDS))]
 
     def visualize_latest(self):
         """
         Plots the phase relationship of 3-6-9 harmonics in polar view
         """
-        if not self.harmonic_log:
+        latest = self.latest()
+        if latest is None:
             print("[Warning] No data to visualize.")
             return
 
-        latest = self.harmonic_log[-1]
         fig = plt.figure(figsize=(5, 5))
         ax = fig.add_subplot(111, polar=True)
 
-        for h in [3, 6, 9]:
+        for h in HARMONICS:
             phase = latest[f"harmonic_{h}_phase"]
             amp = latest[f"harmonic_{h}_amp"]
             ax.plot([0, phase], [0, amp], label=f'H{h}', linewidth=2)
@@ -53,18 +142,52 @@ class EchoDecoderMatrix:
         ax.legend()
         plt.show()
 
-    def export_csv(self, filepath='harmonic_log.csv'):
+    def _pending_rows(self, filepath, append):
+        """Columns to write for `filepath`: everything, or only rows not yet appended there"""
+        start = self._exported.get(filepath, 0) if append else None
+        self._exported[filepath] = self.total_ingested
+        return self.columns(start)
+
+    def export_csv(self, filepath='harmonic_log.csv', append=False):
         """
-        Exports all logged harmonic data to a .csv file
+        Exports all logged harmonic data to a .csv file.
+        With append=True only readings ingested since the last export to the same
+        file are appended (the header is written once).
         """
-        if not self.harmonic_log:
+        if not len(self):
             print("[Info] No data to export.")
             return
 
-        keys = self.harmonic_log[0].keys()
-        with open(filepath, 'w', newline='') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=keys)
-            writer.writeheader()
-            writer.writerows(self.harmonic_log)
+        write_header = not (append and os.path.exists(filepath))
+        cols = self._pending_rows(filepath, append)
+        rows = np.column_stack([cols[f] for f in FIELDS])
+        with open(filepath, 'a' if append else 'w', newline='') as csvfile:
+            np.savetxt(csvfile, rows, delimiter=',', fmt='%.17g',
+                       header=','.join(FIELDS) if write_header else '', comments='')
 
         print(f"[Success] Data exported to {filepath}")
+
+    def export_binary(self, filepath='harmonic_log.bin', append=False):
+        """
+        Exports readings as packed float64 records (RECORD_DTYPE, timestamp first).
+        With append=True only new readings are appended. Load with load_binary().
+        """
+        if not len(self):
+            print("[Info] No data to export.")
+            return
+
+        cols = self._pending_rows(filepath, append)
+        records = np.empty(len(cols["timestamp"]), dtype=RECORD_DTYPE)
+        for name in COLUMNS:
+            records[name] = cols[name]
+        with open(filepath, 'ab' if append else 'wb') as binfile:
+            records.tofile(binfile)
+
+        print(f"[Success] Data exported to {filepath}")
+
+    @staticmethod
+    def load_binary(filepath='harmonic_log.bin', mmap=False):
+        """Load an export_binary() file back as a structured NumPy array without parsing"""
+        if mmap:
+            return np.memmap(filepath, dtype=RECORD_DTYPE, mode='r')
+        return np.fromfile(filepath, dtype=RECORD_DTYPE)
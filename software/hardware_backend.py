@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+hardware_backend.py — IX-Beavis Pluggable Hardware Backend
+Author: Bryce Wooster
+Version: 1.0
+Description:
+Provides the SPI, GPIO and I2C handles used by capture_interface and harmonic_driver.
+The hardware backend opens the real spidev / RPi.GPIO / TCA9548A devices, while the
+simulated backend synthesizes photodiode signals (or replays recorded traces) through a
+virtual MCP3208, logs DAC writes and tracks GPIO/PWM state, so the capture and coil paths
+can be exercised and profiled on ordinary Linux machines.
+
+Select the backend before importing the drivers, either with the environment variable
+IX_BEAVIS_BACKEND=sim (optionally IX_BEAVIS_REPLAY=<trace.npz>) or programmatically:
+
+    import hardware_backend
+    hardware_backend.use_backend(hardware_backend.SimulatedBackend())
+    import capture_interface
+"""
+
+import os
+import time
+import numpy as np
+
+# --- BACKEND SELECTION ---
+BACKEND_ENV_VAR = "IX_BEAVIS_BACKEND"    # 'hardware' (default) or 'sim'
+REPLAY_ENV_VAR = "IX_BEAVIS_REPLAY"      # Optional .npy/.npz trace for the simulated ADC
+
+# --- SIMULATION DEFAULTS ---
+SIM_SAMPLE_RATE = 1_000_000.0   # Hz, virtual conversion clock of the simulated ADC
+SIM_ADC_VREF = 3.3              # V
+SIM_DAC_LOG_SIZE = 1 << 20      # Most recent DAC writes retained by the simulated DAC
+SIM_NOISE_TABLE = 1 << 16       # Length of the precomputed noise table per source
+
+_active_backend = None
+
+
+class SineSource:
+    """
+    Synthesizes a photodiode voltage as a sum of sinusoids plus offset and Gaussian noise.
+    Samples are a pure function of the sample index, so runs are fully deterministic.
+    """
+
+    def __init__(self, freqs=(7.0,), amplitudes=(0.5,), offset=1.65, noise=0.01,
+                 sample_rate=SIM_SAMPLE_RATE, seed=0):
+        self.freqs = np.atleast_1d(np.asarray(freqs, dtype=np.float64))
+        self.amplitudes = np.atleast_1d(np.asarray(amplitudes, dtype=np.float64))
+        self.offset = offset
+        self.noise = noise
+        self.sample_rate = sample_rate
+        self.seed = seed
+        # Indexed by sample number, so single reads and bursts see identical noise
+        self.noise_table = np.random.default_rng(seed).normal(0.0, 1.0, SIM_NOISE_TABLE)
+
+    def sample(self, index):
+        """Return voltages for an array of absolute sample indices"""
+        index = np.asarray(index, dtype=np.int64)
+        t = index / self.sample_rate
+        phase = 2 * np.pi * np.multiply.outer(t, self.freqs)
+        signal = self.offset + np.sin(phase) @ self.amplitudes
+        if self.noise:
+            signal = signal + self.noise * self.noise_table[index % SIM_NOISE_TABLE]
+        return signal
+
+
+class ReplaySource:
+    """
+    Replays a recorded photodiode trace (in volts), optionally looping at the end.
+    """
+
+    def __init__(self, samples, loop=True):
+        self.samples = np.asarray(samples, dtype=np.float64).ravel()
+        if self.samples.size == 0:
+            raise ValueError("Replay trace is empty.")
+        self.loop = loop
+
+    def sample(self, index):
+        """Return recorded voltages for an array of absolute sample indices"""
+        index = np.asarray(index, dtype=np.int64)
+        if self.loop:
+            return self.samples[index % self.samples.size]
+        return self.samples[np.minimum(index, self.samples.size - 1)]
+
+
+def load_replay_sources(path, loop=True):
+    """
+    Load recorded traces from disk into a {channel: ReplaySource} map.
+    Accepts a .npz with one array per channel (keys 'ch0', 'ch1', ... or bare integers)
+    or a .npy array shaped (channels, samples).
+    """
+    loaded = np.load(path)
+    if isinstance(loaded, np.lib.npyio.NpzFile):
+        sources = {}
+        for key in loaded.files:
+            ch = int(key[2:]) if key.startswith("ch") else int(key)
+            sources[ch] = ReplaySource(loaded[key], loop=loop)
+        return sources
+    traces = np.atleast_2d(loaded)
+    return {ch: ReplaySource(trace, loop=loop) for ch, trace in enumerate(traces)}
+
+
+def save_replay_trace(path, signal_data):
+    """Save a capture_photon_trace() data dict as a .npz that load_replay_sources() reads"""
+    np.savez(path, **{f"ch{ch}": np.asarray(v, dtype=np.float64) for ch, v in signal_data.items()})
+
+
+class SimulatedMCP3208:
+    """
+    spidev-compatible stand-in for an MCP3208 ADC. Every 3-byte frame of an xfer2()
+    transaction is one single-ended conversion, so batched multi-channel bursts work
+    exactly as they would on the wire.
+
+    With clock=None a source's time is its conversion count at the source's sample_rate
+    (deterministic, for benchmarks). With a clock (e.g. time.monotonic), sources that
+    have a sample_rate are skipped ahead to the clock's time at every transaction, so a
+    driver sampling every 10 ms sees the signal advance 10 ms. Replayed traces always
+    advance one recorded sample per conversion.
+    """
+
+    def __init__(self, sources=None, vref=SIM_ADC_VREF, resolution=12, block_size=4096, clock=None):
+        self.sources = sources or {}
+        self.clock = clock
+        self._epoch = clock() if clock is not None else 0.0
+        self.vref = vref
+        self.full_scale = (1 << resolution) - 1
+        self.block_size = block_size
+        self.sample_index = np.zeros(8, dtype=np.int64)
+        self.conversions = 0
+        self.max_speed_hz = 0
+        self.mode = 0
+        # Per-channel prefetched codes so single conversions stay cheap
+        self._blocks = [[] for _ in range(8)]
+        self._block_pos = [0] * 8
+
+    def open(self, bus, device):
+        self.bus, self.device = bus, device
+
+    def close(self):
+        pass
+
+    def _synthesize(self, channel, start, count):
+        source = self.sources.get(channel)
+        if source is None:
+            return np.zeros(count, dtype=np.int64)
+        volts = source.sample(np.arange(start, start + count))
+        codes = np.rint(volts / self.vref * (self.full_scale + 1))
+        return np.clip(codes, 0, self.full_scale).astype(np.int64)
+
+    def _clocked(self, channel):
+        return self.clock is not None and getattr(self.sources.get(channel), "sample_rate", None) is not None
+
+    def _catch_up(self, channel):
+        """Move a clocked channel's next sample index up to the present, dropping stale prefetch"""
+        now = int((self.clock() - self._epoch) * self.sources[channel].sample_rate)
+        pending = len(self._blocks[channel]) - self._block_pos[channel]
+        if now > self.sample_index[channel] - pending:
+            self._blocks[channel], self._block_pos[channel] = [], 0
+            self.sample_index[channel] = now
+
+    def _next_code(self, channel):
+        """Produce the next 12-bit code for one channel from its prefetched block"""
+        pos = self._block_pos[channel]
+        block = self._blocks[channel]
+        if pos >= len(block):
+            block = self._synthesize(channel, self.sample_index[channel], self.block_size).tolist()
+            self.sample_index[channel] += self.block_size
+            self._blocks[channel] = block
+            pos = 0
+        self._block_pos[channel] = pos + 1
+        return block[pos]
+
+    def _codes(self, channel, count):
+        """Produce the next `count` 12-bit codes for one channel"""
+        pending = len(self._blocks[channel]) - self._block_pos[channel]
+        if count <= pending:
+            return np.array([self._next_code(channel) for _ in range(count)], dtype=np.int64)
+        head = np.array(self._blocks[channel][self._block_pos[channel]:], dtype=np.int64)
+        self._blocks[channel], self._block_pos[channel] = [], 0
+        tail = self._synthesize(channel, self.sample_index[channel], count - pending)
+        self.sample_index[channel] += count - pending
+        return np.concatenate([head, tail])
+
+    def xfer2(self, data):
+        if len(data) == 3:
+            # Single conversion: the classic read_adc() transaction
+            channel = (data[0] >> 3) & 0x07
+            if self._clocked(channel):
+                self._catch_up(channel)
+                code = int(self._codes(channel, 1)[0])
+            else:
+                code = self._next_code(channel)
+            self.conversions += 1
+            return [0, (code >> 8) & 0x0F, code & 0xFF]
+        frames = np.asarray(data, dtype=np.uint8).reshape(-1, 3)
+        channels = (frames[:, 0] >> 3) & 0x07
+        codes = np.empty(len(frames), dtype=np.int64)
+        for ch in np.unique(channels):
+            if self._clocked(int(ch)):
+                self._catch_up(int(ch))
+            mask = channels == ch
+            codes[mask] = self._codes(int(ch), int(np.count_nonzero(mask)))
+        reply = np.zeros_like(frames)
+        reply[:, 1] = (codes >> 8) & 0x0F
+        reply[:, 2] = codes & 0xFF
+        self.conversions += len(frames)
+        return reply.ravel().tolist()
+
+    def read_codes(self, channel, count):
+        """Fast path for benchmarks: fetch `count` raw codes without building SPI frames"""
+        self.conversions += count
+        if self._clocked(channel):
+            self._catch_up(channel)
+        return self._codes(channel, count)
+
+
+class SimulatedDAC:
+    """
+    spidev-compatible stand-in for the coil DAC. Decodes 2-byte channel/value frames and
+    keeps a bounded log of the most recent writes plus the last value on every channel.
+    """
+
+    def __init__(self, log_size=SIM_DAC_LOG_SIZE, channels=16):
+        self.log_channel = np.zeros(log_size, dtype=np.uint8)
+        self.log_value = np.zeros(log_size, dtype=np.uint16)
+        self.last_value = np.zeros(channels, dtype=np.uint16)
+        self.writes = 0
+        self.max_speed_hz = 0
+        self.mode = 0
+
+    def open(self, bus, device):
+        self.bus, self.device = bus, device
+
+    def close(self):
+        pass
+
+    def xfer2(self, data):
+        frames = np.asarray(data, dtype=np.uint16).reshape(-1, 2)
+        channels = (frames[:, 0] >> 4) & 0x0F
+        values = ((frames[:, 0] & 0x0F) << 8) | frames[:, 1]
+        slots = (self.writes + np.arange(len(frames))) % self.log_channel.size
+        self.log_channel[slots] = channels
+        self.log_value[slots] = values
+        self.last_value[channels] = values
+        self.writes += len(frames)
+        return [0] * len(data)
+
+    def history(self, channel=None):
+        """Return (channels, values) of retained writes in chronological order"""
+        size = self.log_channel.size
+        count = min(self.writes, size)
+        order = (self.writes - count + np.arange(count)) % size
+        channels, values = self.log_channel[order], self.log_value[order]
+        if channel is not None:
+            keep = channels == channel
+            return channels[keep], values[keep]
+        return channels, values
+
+
+class SimulatedPWM:
+    """RPi.GPIO.PWM stand-in that records frequency/duty changes without blocking"""
+
+    def __init__(self, gpio, pin, frequency):
+        self.gpio = gpio
+        self.pin = pin
+        self.frequency = frequency
+        self.duty_cycle = 0.0
+        self.running = False
+
+    def start(self, duty_cycle):
+        self.duty_cycle = duty_cycle
+        self.running = True
+
+    def ChangeDutyCycle(self, duty_cycle):
+        self.duty_cycle = duty_cycle
+
+    def ChangeFrequency(self, frequency):
+        self.frequency = frequency
+
+    def stop(self):
+        self.running = False
+
+
+class SimulatedGPIO:
+    """
+    Module-shaped stand-in for RPi.GPIO: pin modes, output levels and PWM channels are
+    tracked in memory so mirror sequencing can be inspected after a run.
+    """
+
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+
+    def __init__(self):
+        self.mode = None
+        self.pin_modes = {}
+        self.pin_levels = {}
+        self.output_calls = 0
+        self.pwm_channels = []
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, direction, initial=LOW):
+        self.pin_modes[pin] = direction
+        self.pin_levels.setdefault(pin, initial)
+
+    def output(self, pin, level):
+        self.pin_levels[pin] = level
+        self.output_calls += 1
+
+    def input(self, pin):
+        return self.pin_levels.get(pin, self.LOW)
+
+    def PWM(self, pin, frequency):
+        pwm = SimulatedPWM(self, pin, frequency)
+        self.pwm_channels.append(pwm)
+        return pwm
+
+    def cleanup(self):
+        self.pin_modes.clear()
+        self.pin_levels.clear()
+
+
+class HardwareBackend:
+    """Opens the physical SPI, GPIO and I2C devices on the Raspberry Pi"""
+
+    name = "hardware"
+
+    def open_spi(self, bus, device, max_speed_hz, role="adc"):
+        import spidev
+        spi = spidev.SpiDev()
+        spi.open(bus, device)
+        spi.max_speed_hz = max_speed_hz
+        return spi
+
+    def gpio(self):
+        import RPi.GPIO as GPIO
+        return GPIO
+
+    def open_i2c_mux(self):
+        import board
+        import busio
+        import adafruit_tca9548a  # For I2C multiplexer control
+        i2c = busio.I2C(board.SCL, board.SDA)
+        return i2c, adafruit_tca9548a.TCA9548A(i2c)
+
+
+class SimulatedBackend:
+    """
+    Off-Pi backend: virtual MCP3208 fed by per-channel signal sources, logging DAC and
+    in-memory GPIO. Devices are shared per role so drivers and benchmarks see one state.
+    The ADC follows `clock` (wall time by default, so captured tones come out at their
+    real frequencies); clock=None makes it a pure function of the conversion count.
+    """
+
+    name = "sim"
+
+    def __init__(self, sources=None, dac_log_size=SIM_DAC_LOG_SIZE, clock=time.monotonic):
+        if sources is None:
+            # UV / Visible / IR photodiodes with distinct, easily recognisable tones
+            sources = {
+                0: SineSource(freqs=(7.0, 41.0), amplitudes=(0.6, 0.1), seed=0),
+                1: SineSource(freqs=(13.0,), amplitudes=(0.5,), seed=1),
+                2: SineSource(freqs=(3.0, 29.0), amplitudes=(0.4, 0.2), seed=2),
+            }
+        self.adc = SimulatedMCP3208(sources, clock=clock)
+        self.dac = SimulatedDAC(log_size=dac_log_size)
+        self._gpio = SimulatedGPIO()
+
+    def open_spi(self, bus, device, max_speed_hz, role="adc"):
+        spi = self.dac if role == "dac" else self.adc
+        spi.open(bus, device)
+        spi.max_speed_hz = max_speed_hz
+        return spi
+
+    def gpio(self):
+        return self._gpio
+
+    def open_i2c_mux(self):
+        return None, None
+
+
+def use_backend(backend):
+    """Install the process-wide backend; call before importing the drivers"""
+    global _active_backend
+    _active_backend = backend
+    return backend
+
+
+def get_backend():
+    """Return the active backend, creating it from IX_BEAVIS_BACKEND on first use"""
+    global _active_backend
+    if _active_backend is None:
+        choice = os.environ.get(BACKEND_ENV_VAR, "hardware").lower()
+        if choice in ("sim", "simulated"):
+            replay = os.environ.get(REPLAY_ENV_VAR)
+            sources = load_replay_sources(replay) if replay else None
+            _active_backend = SimulatedBackend(sources)
+        elif choice == "hardware":
+            _active_backend = HardwareBackend()
+        else:
+            raise ValueError(f"Unknown {BACKEND_ENV_VAR} value: {choice!r}")
+    return _active_backend
@@ -10,10 +10,7 @@ phase-lock loop logic, and live feedback from field monitoring sensors.
 
 import time
 import numpy as np
-import RPi.GPIO as GPIO
-from scipy.signal import chirp
-import spidev  # SPI comm for DACs and digital pots
-import serial   # Optional: UART comm to OCXO or monitoring system
+from hardware_backend import get_backend  # Real SPI/GPIO or simulated (IX_BEAVIS_BACKEND=sim)
 
 # --- SYSTEM PARAMETERS (Editable) ---
 COIL_FREQS = {
@@ -24,50 +21,153 @@ COIL_FREQS = {
 
 SWEEP_MODE = True         # Enable frequency sweep in initialization
 SWEEP_DURATION = 30       # Seconds for full sweep
-COIL_UPDATE_RATE = 0.1    # Seconds between updates
 DAC_CHANNEL_MAP = {'type3': 0, 'type6': 1, 'type9': 2}
 PHASE_OFFSET = {'type3': 0, 'type6': np.pi / 3, 'type9': 2*np.pi / 3}
 
+# --- DDS OUTPUT ENGINE ---
+COIL_ORDER = ('type3', 'type6', 'type9')   # Interleave order within each SPI burst
+DDS_OUTPUT_RATE = 4000    # Hz, DAC samples per coil per second
+DDS_FRAME_SAMPLES = 64    # Samples per coil per SPI burst (16 ms frames at 4 kHz)
+DDS_PHASE_BITS = 32       # Phase accumulator width
+DDS_TABLE_BITS = 12       # 4096-entry wavetable
+DAC_WORD_BITS = 16        # Bits clocked per DAC write
+DDS_SPI_HEADROOM = 2      # Bus clock multiple over the bare output bit rate
+# A burst fills only 1/DDS_SPI_HEADROOM of its frame period on the wire, leaving slack for
+# rendering and driver overhead; the frame deadlines in DDSEngine.stream() set the pace
+DDS_SPI_SPEED_HZ = DDS_SPI_HEADROOM * DDS_OUTPUT_RATE * len(COIL_ORDER) * DAC_WORD_BITS
+
 # --- SPI/DAC Configuration ---
-spi = spidev.SpiDev()
-spi.open(0, 0)
-spi.max_speed_hz = 500000
+backend = get_backend()
+spi = backend.open_spi(0, 0, max_speed_hz=500000, role="dac")  # SPI comm for DACs and digital pots
+GPIO = backend.gpio()
 
 def write_dac(channel, value):
     """Send voltage value to DAC for analog waveform output"""
     command = [channel << 4 | (value >> 8) & 0x0F, value & 0xFF]
     spi.xfer2(command)
 
+def write_dac_frame(codes, channel_hi):
+    """Stream an (n_samples, n_coils) block of 12-bit codes as one interleaved SPI burst"""
+    burst = np.empty(codes.shape + (2,), dtype=np.uint16)
+    burst[..., 0] = channel_hi | ((codes >> 8) & 0x0F)
+    burst[..., 1] = codes & 0xFF
+    spi.xfer2(burst.ravel().tolist())
+
 def generate_wave(freq, phase=0, duration=1.0, rate=1000):
     """Generate a phase-locked sinusoidal waveform"""
     t = np.linspace(0, duration, int(rate * duration), endpoint=False)
     return np.sin(2 * np.pi * freq * t + phase)
 
-def initialize_sweep():
+class DDSEngine:
+    """
+    Direct-digital-synthesis output for the 3-6-9 coils: a 32-bit phase accumulator per
+    coil indexes a precomputed sine wavetable, and rendered frames are streamed to the
+    DAC at DDS_OUTPUT_RATE with the coil channels interleaved per SPI burst.
+    """
+
+    def __init__(self, freq_map=COIL_FREQS, rate=DDS_OUTPUT_RATE, frame_samples=DDS_FRAME_SAMPLES):
+        self.rate = rate
+        self.frame_samples = frame_samples
+        self.phase_mask = np.uint64((1 << DDS_PHASE_BITS) - 1)
+        self.table_shift = np.uint64(DDS_PHASE_BITS - DDS_TABLE_BITS)
+        k = np.arange(1 << DDS_TABLE_BITS)
+        self.wavetable = np.rint((np.sin(2 * np.pi * k / k.size) + 1.0) * 2047).astype(np.uint16)
+        self.channel_hi = np.array([DAC_CHANNEL_MAP[c] << 4 for c in COIL_ORDER], dtype=np.uint16)
+        offsets = np.array([PHASE_OFFSET[c] for c in COIL_ORDER]) / (2 * np.pi)
+        self.phase_acc = np.round(offsets * (1 << DDS_PHASE_BITS)).astype(np.uint64) & self.phase_mask
+        self.tuning = self.tuning_words([COIL_FREQS[c] for c in COIL_ORDER])
+        self.set_frequencies(freq_map)
+
+    def tuning_words(self, freqs):
+        """Convert frequencies (Hz, any shape) into phase increments per output sample"""
+        words = np.round(np.asarray(freqs, dtype=np.float64) * (1 << DDS_PHASE_BITS) / self.rate)
+        return words.astype(np.uint64) & self.phase_mask
+
+    def set_frequencies(self, freq_map):
+        """Retune the coils named in freq_map; the others keep their current frequency.
+        Phase is continuous across the change"""
+        tuning = self.tuning.copy()
+        for i, coil in enumerate(COIL_ORDER):
+            if coil in freq_map:
+                tuning[i] = self.tuning_words(freq_map[coil])
+        self.tuning = tuning
+
+    def render(self, n_samples=None, schedule=None):
+        """
+        Render the next block of 12-bit codes shaped (n_samples, n_coils).
+        `schedule` optionally supplies per-sample tuning words for sweeps.
+        """
+        if schedule is None:
+            steps = np.outer(np.arange(n_samples or self.frame_samples, dtype=np.uint64), self.tuning)
+            advance = steps[-1] + self.tuning
+        else:
+            advance = np.cumsum(schedule, axis=0, dtype=np.uint64)
+            steps = advance - schedule
+            advance = advance[-1]
+        phases = (self.phase_acc + steps) & self.phase_mask
+        self.phase_acc = (self.phase_acc + advance) & self.phase_mask
+        return self.wavetable[phases >> self.table_shift]
+
+    def stream(self, schedule=None, n_frames=None):
+        """
+        Stream frames to the DAC on absolute frame deadlines. With a tuning schedule the
+        stream ends when the schedule is exhausted; otherwise after n_frames (or forever).
+        """
+        period = self.frame_samples / self.rate
+        if schedule is not None:
+            n_frames = -(-len(schedule) // self.frame_samples)
+        start_time = time.monotonic()
+        i = 0
+        while n_frames is None or i < n_frames:
+            if schedule is None:
+                codes = self.render()
+            else:
+                codes = self.render(schedule=schedule[i * self.frame_samples:(i + 1) * self.frame_samples])
+            remaining = start_time + i * period - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+            write_dac_frame(codes, self.channel_hi)
+            i += 1
+
+def sweep_schedule(engine, sweep_time=SWEEP_DURATION):
+    """Precompute per-sample tuning words for the start-up calibration sweep"""
+    t = np.arange(int(sweep_time * engine.rate)) / engine.rate
+    u = t / sweep_time
+    freqs = np.column_stack([
+        2.0 + (4.5 - 2.0) * u,             # linear
+        25.0 * (45.0 / 25.0) ** u,          # logarithmic
+        360.0 + (369.0 - 360.0) * u ** 2,   # quadratic
+    ])
+    return engine.tuning_words(freqs)
+
+dds_engine = None
+
+def get_dds_engine():
+    """Lazily create the shared DDS engine (and clock the SPI bus for streaming)"""
+    global dds_engine
+    if dds_engine is None:
+        spi.max_speed_hz = DDS_SPI_SPEED_HZ
+        dds_engine = DDSEngine()
+    return dds_engine
+
+def initialize_sweep(engine=None):
     """Optional: sweep frequencies on startup to stabilize field before lock-in"""
+    engine = engine or get_dds_engine()
     print("[*] Beginning harmonic sweep calibration...")
-    sweep_time = SWEEP_DURATION
-    for t in np.linspace(0.1, sweep_time, num=300):
-        f3 = chirp(t, f0=2.0, f1=4.5, t1=sweep_time, method='linear')
-        f6 = chirp(t, f0=25.0, f1=45.0, t1=sweep_time, method='logarithmic')
-        f9 = chirp(t, f0=360.0, f1=369.0, t1=sweep_time, method='quadratic')
-        apply_harmonics({'type3': f3, 'type6': f6, 'type9': f9})
-        time.sleep(0.05)
-
-def apply_harmonics(freq_map):
-    """Update coil output with synchronized harmonic waveforms"""
-    for coil, freq in freq_map.items():
-        phase = PHASE_OFFSET[coil]
-        waveform = generate_wave(freq, phase, duration=0.05)
-        voltage = int((np.mean(waveform) + 1.0) * 2047)  # Normalize to 12-bit DAC
-        write_dac(DAC_CHANNEL_MAP[coil], voltage)
-
-def main_loop():
+    engine.stream(schedule=sweep_schedule(engine))
+
+def apply_harmonics(freq_map, engine=None):
+    """Retune the coils and stream one synchronized frame of harmonic output"""
+    engine = engine or get_dds_engine()
+    engine.set_frequencies(freq_map)
+    write_dac_frame(engine.render(), engine.channel_hi)
+
+def main_loop(engine=None):
+    engine = engine or get_dds_engine()
     print("[*] Harmonic driver running (GOD mode)")
+    engine.set_frequencies(COIL_FREQS)
     try:
-        while True:
-            apply_harmonics(COIL_FREQS)
-            time.sleep(COIL_UPDATE_RATE)
+        engine.stream()
     except KeyboardInterrupt:
         print("\n[!] Shutting down harmonic driver.")
 
@@ -0,0 +1,66 @@
+# /tests/test_deep_field_sensor_array.py
+# Memory-mapped exposure checkpoint / resume tests
+# Author: Bryce Wooster
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'sensors'))
+
+from deep_field_sensor_array import DeepFieldSensorArray
+
+
+def test_restart_resumes_from_checkpoint(tmp_path):
+    path = str(tmp_path / 'exposure')
+    sensor = DeepFieldSensorArray(width=40, height=70, storage_path=path)
+    sensor.accumulate_arrays([1, 2, 2], [3, 4, 4], 1.5)
+    sensor.checkpoint()
+    saved = np.array(sensor.signal_matrix)
+    noise = np.array(sensor.noise_profile)
+    sensor.accumulate_arrays([5], [6], 9.0)
+    del sensor  # crash: the last batch was never checkpointed
+
+    resumed = DeepFieldSensorArray(width=40, height=70, storage_path=path)
+    assert resumed.events_integrated == 3
+    assert np.array_equal(resumed.signal_matrix, saved)
+    assert np.array_equal(resumed.noise_profile, noise)
+
+
+def test_restart_without_checkpoint_keeps_accumulator(tmp_path):
+    path = str(tmp_path / 'exposure')
+    sensor = DeepFieldSensorArray(width=40, height=70, storage_path=path, checkpoint_every_s=None)
+    sensor.accumulate_arrays([1, 2], [3, 4], 2.0)
+    sensor.signal_matrix.flush()
+    del sensor
+
+    reopened = DeepFieldSensorArray(width=40, height=70, storage_path=path)
+    assert reopened.signal_matrix[3, 1] == 2.0 and reopened.signal_matrix[4, 2] == 2.0
+
+
+def test_fresh_start_discards_old_exposure(tmp_path):
+    path = str(tmp_path / 'exposure')
+    sensor = DeepFieldSensorArray(width=40, height=70, storage_path=path)
+    sensor.accumulate_arrays([1], [3], 2.0)
+    sensor.checkpoint()
+    del sensor
+
+    fresh = DeepFieldSensorArray(width=40, height=70, storage_path=path, resume=False)
+    assert not os.path.exists(path + '.ckpt')
+    assert fresh.events_integrated == 0 and not fresh.signal_matrix.any()
+    del fresh
+    assert DeepFieldSensorArray(width=40, height=70, storage_path=path).events_integrated == 0
+
+
+def test_geometry_change_regenerates_noise(tmp_path):
+    path = str(tmp_path / 'exposure')
+    sensor = DeepFieldSensorArray(width=200, height=150, storage_path=path)
+    sensor.accumulate_arrays([1], [3], 2.0)
+    sensor.checkpoint()
+    del sensor
+
+    resized = DeepFieldSensorArray(width=100, height=150, storage_path=path)
+    assert resized.noise_profile.shape == (150, 100)
+    assert resized.events_integrated == 0
+    assert resized.finalize_image().shape == (150, 100)
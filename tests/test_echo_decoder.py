@@ -0,0 +1,64 @@
+# /tests/test_echo_decoder.py
+# Streaming echo detector regression tests
+# Author: Bryce Wooster
+
+import os
+import sys
+import tracemalloc
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'software'))
+
+from echo_decoder import SAMPLE_RATE, StreamingEchoDetector, detect_echo_peaks
+
+
+def stream_trace(detector, trace, chunk_size):
+    times, amplitudes = [], []
+    for start in range(0, len(trace), chunk_size):
+        t, a = detector.feed(trace[start:start + chunk_size])
+        times.extend(t)
+        amplitudes.extend(a)
+    t, a = detector.flush()
+    times.extend(t)
+    amplitudes.extend(a)
+    return np.array(times), np.array(amplitudes)
+
+
+@pytest.mark.parametrize('chunk_size', [7, 64, 100, 999])
+def test_streamed_echoes_match_whole_trace(chunk_size):
+    rng = np.random.default_rng(3)
+    n = 6000
+    k = np.arange(n)
+    trace = 0.02 * rng.standard_normal(n)
+    # Gaussian-gated 20 Hz echoes of varying strength on a weak noise floor
+    for centre in rng.choice(np.arange(300, n - 300), 25, replace=False):
+        trace += (rng.uniform(0.3, 1.0) * np.exp(-0.5 * ((k - centre) / 4) ** 2)
+                  * np.cos(2 * np.pi * 20 * (k - centre) / SAMPLE_RATE))
+    expected_times, envelope = detect_echo_peaks(trace)
+
+    times, amplitudes = stream_trace(StreamingEchoDetector(), trace, chunk_size)
+    assert np.array_equal(times, expected_times)
+    assert np.allclose(amplitudes, envelope[np.rint(expected_times * SAMPLE_RATE).astype(int)], rtol=0.01)
+
+
+def test_constant_signal_runs_in_bounded_memory():
+    detector = StreamingEchoDetector()
+    chunk = np.full(100, 0.5)
+    for _ in range(200):
+        times, _ = detector.feed(chunk)
+        assert len(times) == 0
+    tracemalloc.start()
+    try:
+        for _ in range(3000):
+            times, _ = detector.feed(chunk)
+            assert len(times) == 0
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # An unbounded plateau carry would grow past 2 MB of float64 here
+    assert peak < 200_000
+    times, _ = detector.flush()
+    assert len(times) == 0
+    assert detector.emitted == 3200 * len(chunk)
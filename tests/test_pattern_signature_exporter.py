@@ -0,0 +1,49 @@
+# /tests/test_pattern_signature_exporter.py
+# Signature log and sketch sidecar round-trip tests
+# Author: Bryce Wooster
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'ai'))
+
+from pattern_signature_exporter import PatternSignatureExporter
+
+
+def test_hash_ending_in_zero_byte_survives_reload(tmp_path):
+    path = str(tmp_path / 'signatures_db.json')
+    signature_hash = 'c3' * 31 + '00'
+    coords = np.random.default_rng(0).random((40, 2)) * 512
+    labels = np.arange(40) % 4
+
+    exporter = PatternSignatureExporter(export_path=path)
+    exporter.generate_hash = lambda coords, labels: signature_hash
+    assert exporter.export_signature(coords, labels) == signature_hash
+    exporter.close()
+
+    reloaded = PatternSignatureExporter(export_path=path)
+    reloaded.load_existing()
+    assert reloaded.get_signature(signature_hash)['signature_hash'] == signature_hash
+    assert reloaded.similarity_index.hashes == [signature_hash]
+    assert reloaded.find_similar(coords, labels, k=1)[0][0] == signature_hash
+
+
+def test_torn_last_record_is_dropped_before_appending(tmp_path):
+    path = str(tmp_path / 'signatures_db.json')
+    rng = np.random.default_rng(1)
+    with PatternSignatureExporter(export_path=path) as exporter:
+        first = exporter.export_signature(rng.random((20, 2)), np.arange(20) % 3)
+    with open(path, 'ab') as f:
+        f.write(b'{"signature_hash": "' + b'ab' * 32 + b'", "timestamp_utc": "20')
+
+    with PatternSignatureExporter(export_path=path) as exporter:
+        exporter.load_existing()
+        second = exporter.export_signature(rng.random((20, 2)), np.arange(20) % 4)
+
+    reloaded = PatternSignatureExporter(export_path=path)
+    reloaded.load_existing()
+    assert sorted(reloaded.index) == sorted([first, second])
+    assert reloaded.get_signature(second)['signature_hash'] == second
+    assert [record['signature_hash'] for record in reloaded.signature_log] == [first, second]
@@ -0,0 +1,58 @@
+# /tests/test_photon_event_matrix.py
+# Event ring ordering, spatial bucket index and query tests
+# Author: Bryce Wooster
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'detectors'))
+
+from photon_event_matrix import PhotonEventMatrix
+
+
+def test_unsorted_bulk_block_is_kept_in_time_order():
+    matrix = PhotonEventMatrix(max_events=16)
+    matrix.log_events([0.0, 1.0, 2.0, 3.0], [0.0] * 4, [0.0] * 4, timestamp_ns=[5, 3, 4, 6])
+    assert matrix.late_events == 0
+    assert matrix.held_events()['timestamp_ns'].tolist() == [3, 4, 5, 6]
+    assert matrix.held_events()['x'].tolist() == [1.0, 2.0, 0.0, 3.0]
+
+    matrix.log_events([4.0, 5.0], [0.0] * 2, [0.0] * 2, timestamp_ns=[7, 2])
+    assert matrix.late_events == 1
+    assert matrix.held_events()['timestamp_ns'].tolist() == [3, 4, 5, 6, 7]
+
+
+@pytest.mark.parametrize('mirrored', [False, True])
+def test_region_and_time_queries_match_brute_force(mirrored):
+    rng = np.random.default_rng(7)
+    matrix = PhotonEventMatrix(max_events=5000, grid_bounds=(0.0, 0.0, 100.0, 100.0),
+                               grid_shape=(16, 16), mirrored=mirrored)
+    stamp = 0
+    for _ in range(12):
+        n = int(rng.integers(200, 1500))
+        stamps = stamp + rng.integers(0, 1000, n)
+        # Some hits fall off the grid and clip into the edge buckets
+        matrix.log_events(rng.uniform(-10, 110, n), rng.uniform(-10, 110, n),
+                          rng.integers(0, 4, n).astype(np.float32), timestamp_ns=stamps)
+        stamp = int(stamps.max())
+
+    held = matrix.held_events()
+    assert len(held) == matrix.max_events
+    assert np.all(np.diff(held['timestamp_ns']) >= 0)
+    t = held['timestamp_ns']
+    start_ns, end_ns = int(t[len(t) // 4]), int(t[3 * len(t) // 4])
+    lo, hi = matrix.time_window(start_ns, end_ns)
+    assert np.array_equal(np.flatnonzero((t >= start_ns) & (t < end_ns)), np.arange(lo, hi))
+    assert np.array_equal(matrix.query_time_range(start_ns, end_ns), held[lo:hi])
+
+    for box in [(20.0, 30.0, 27.5, 41.0), (-5.0, -5.0, 8.0, 12.0), (10.0, 10.0, 90.0, 90.0)]:
+        x_min, y_min, x_max, y_max = box
+        inside = (held['x'] >= x_min) & (held['x'] < x_max) & (held['y'] >= y_min) & (held['y'] < y_max)
+        assert np.array_equal(matrix.query_region(*box), np.flatnonzero(inside))
+        in_window = inside & (t >= start_ns) & (t < end_ns)
+        assert np.array_equal(matrix.query_region(*box, start_ns=start_ns, end_ns=end_ns),
+                              np.flatnonzero(in_window))
+    assert np.array_equal(matrix.query_phase(2.0), np.flatnonzero(held['phase_tag'] == 2.0))